@@ -6,8 +6,9 @@ from tkinter import ttk
 from tkinter import filedialog
 import tkinter.font as tkfont
 
-from pickle import load as pickle_load
-from pickle import dump as pickle_dump
+from pickle import dumps as pickle_dumps
+from pickle import Pickler, Unpickler
+from io import BytesIO
 
 from subprocess import call as subp_call
 from subprocess import Popen as subp_popen
@@ -16,13 +17,35 @@ import re
 import datetime
 import sys, os
 import ntpath
+import random
+import hashlib
+import threading
+import tempfile
+import sqlite3
+import json
+import gzip
+import zlib
+import html
+import xml.etree.ElementTree as ET
+import multiprocessing
+import time
+import argparse
+import contextlib
+import functools
+import bisect
+import heapq
+import math
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
 
 try:
     # python 2
-    from urllib2 import Request, urlopen, quote
+    from urllib2 import Request, urlopen, quote, unquote
 except ImportError:
     # python 3
-    from urllib.request import Request, urlopen, quote
+    from urllib.request import Request, urlopen, quote, unquote
+
+from urllib.parse import urlparse, parse_qs
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 
 try:
     # python 2
@@ -34,6 +57,9 @@ except ImportError:
 # request google scholar for bibtex
 GOOGLE_SCHOLAR_URL = "https://scholar.google.com"
 HEADERS = {'User-Agent': 'Mozilla/5.0'}
+# resolve the doi of an imported pdf to bibtex, and the timeout (s) of a request
+DOI_URL = "https://doi.org/"
+DOI_TIMEOUT = 10
 
 # to support relative path across linux, mac and windows
 
@@ -49,9 +75,71 @@ lib_file = os.path.join(application_path, "papers.dat")
 toread_file = os.path.join(application_path, "toread.txt")
 unread_file = os.path.join(application_path, "unread.txt")
 conference_file = os.path.join(application_path, "conference.dat")
+offline_index_file = os.path.join(application_path, "metadata.db")
+lib_db_file = os.path.join(application_path, "papers.db")
+lib_shards_dir = os.path.join(application_path, "papers.shards")
+lib_blobs_dir = os.path.join(application_path, "papers.blobs")
+lib_index_file = os.path.join(application_path, "papers.index")
+mounts_file = os.path.join(application_path, "libraries.txt")
 DEFAULT_YEAR = 1900
 MAX_RATING = 5
 OTHERS_CONFERENCE = 'others'
+# typo-tolerant author matching: edit distance allowed between normalized labels,
+# only applied to labels long enough that one edit can't turn one name into another
+AUTHOR_MAX_DISTANCE = 1
+AUTHOR_FUZZY_MIN_LENGTH = 12
+# near-duplicate papers: minhash permutations, lsh bands and the jaccard threshold of a duplicate pair
+MINHASH_PERMUTATIONS = 64
+MINHASH_BANDS = 16
+DUPLICATE_THRESHOLD = 0.7
+# content hash of files
+HASH_CHUNK_SIZE = 1 << 20
+HASH_WORKERS = 8
+# paths checked against cached directory listings and stats for some seconds, and folders listed in parallel
+STAT_TTL = 5.0
+STAT_WORKERS = 8
+# pdf metadata on import: bytes read from a pdf, content streams searched for doi/arxiv id,
+# and the least number of files to use a process pool
+PDF_MAX_READ = 8 << 20
+PDF_MAX_STREAMS = 32
+IMPORT_POOL_MIN_FILES = 8
+# the most items sent to a process of a pool at once, a cancel waits for the chunks being processed
+POOL_MAX_CHUNK = 64
+# renew: the least number of papers to extract their bibtex fields by a process pool, and papers per progress report
+REPARSE_POOL_MIN_PAPERS = 1000
+REPARSE_PROGRESS_STEP = 1000
+# read the selected pdf and its neighbouring rows ahead: bytes read per selection and per file, rows each side, 0 budget to disable
+PREFETCH_BUDGET = 64 << 20
+PREFETCH_MAX_READ = 32 << 20
+PREFETCH_NEIGHBORS = 1
+# local read-only http service, and the least interval (s) between checks of the library file
+SERVER_HOST = '127.0.0.1'
+SERVER_PORT = 8765
+SERVER_RELOAD_INTERVAL = 1.0
+# libraries of other folders searched together with the current one: worker threads, each queries one library
+FEDERATION_WORKERS = 8
+# background tasks of the gui: worker threads and the interval (ms) to check them
+TASK_WORKERS = 2
+TASK_POLL_INTERVAL = 50
+# autosave the library some time (ms) after the last edit, 0 to disable
+AUTOSAVE_DELAY = 2000
+# check every some time (ms) if the library is changed by another computer, 0 to disable
+RELOAD_INTERVAL = 3000
+# search as you type: the delay (ms) after the last keystroke
+SEARCH_DELAY = 40
+# completions shown for author, tag, project and dataset inputs
+COMPLETION_LIMIT = 8
+# related papers: the number shown, the weight of each kind of shared information,
+# and the most papers a shared item may have to bring candidates, more common ones only rank them
+RELATED_LIMIT = 10
+RELATED_WEIGHTS = {'author': 3.0, 'tag': 2.0, 'project': 2.0, 'dataset': 1.5, 'venue': 0.5, 'term': 1.0}
+RELATED_MAX_POSTINGS = 1000
+# sharded storage: number of shard files the papers are spread over by id
+SHARD_COUNT = 16
+# conflicts listed by the merge dialog
+MERGE_SHOWN_CONFLICTS = 20
+# blob store: notes and bibtex from this size (characters) are kept in their own files, referenced by the library
+BLOB_MIN_SIZE = 256
 
 # Build a list of tuples for each file type the file dialog should display
 my_filetypes = [('all files', '.*'), ('pdf files', '.pdf'), ('Word files', '.doc'), ('Word files', '.docx'), ('text files', '.txt')]
@@ -82,6 +170,7 @@ class Category:
 
 author_format_re = re.compile(r'^(.+?)[, ](.+?);(.*)')
 author_format1_re = re.compile(r'^(.+?)[, ](.+?) and (.*)')
+author_key_re = re.compile(r'[^a-z0-9,]')
 class Author(Category):
     def __init__(self, label):
         self.last_name, self.first_name = self.nameParse(label)
@@ -129,6 +218,15 @@ class Author(Category):
             authors.append(item)
         return authors
     
+    # full names of an author string, without a library
+    @classmethod
+    def parseFullNames(cls, author_str):
+        full_names = []
+        for item in cls.parseAuthorString(author_str):
+            last_name, first_name = cls.nameParse(item)
+            full_names.append(cls.getFullname(first_name, last_name))
+        return full_names
+
     @classmethod
     def parseAuthorString(cls, author_str):
         m = author_format_re.match(author_str)
@@ -138,6 +236,9 @@ class Author(Category):
             items = cls.parse(author_str)
         elif m1:
             items = cls.parseFormat1(author_str)
+        elif ';' in author_str:
+            # e.g., 'smith;' as completed, without the trailing separator
+            items = cls.parse(author_str)
         else:
             items = [author_str]
         return items
@@ -153,6 +254,11 @@ class Author(Category):
     @classmethod
     def bibString(cls, authors):
         return ' and '.join([a.label for a in authors])
+
+    # key used for typo-tolerant matching, e.g., 'li, jia-lun' -> 'li,jialun'
+    @classmethod
+    def matchKey(cls, label):
+        return author_key_re.sub('', label.lower())
     
     @classmethod
     def guiString(cls, authors):
@@ -221,9 +327,28 @@ class Bib:
         self._first_title_word = ""
         self._first_author_name = ""
 
-        self.bibtex = ""
+        self._bibtex = ""    # or BlobRef, loaded once used
         self.type = 0       # 0: conference, 1: jornal
 
+    def __setstate__(self, state):
+        # libraries saved by former versions
+        if 'bibtex' in state:
+            state['_bibtex'] = state.pop('bibtex')
+        self.__dict__.update(state)
+
+    @property
+    def bibtex(self):
+        if isinstance(self._bibtex, BlobRef):
+            text = self._bibtex.load()
+            # kept referenced while missing, e.g., not synchronized yet
+            if text is None: return ""
+            self._bibtex = text
+        return self._bibtex
+
+    @bibtex.setter
+    def bibtex(self, value):
+        self._bibtex = value
+
     @property
     def title(self):
         return self._title
@@ -299,13 +424,27 @@ class bibParser:
 
     @classmethod
     def parse(cls, bib_str, lib=None):
+        return cls.buildBib(bib_str, cls.extractFields(bib_str), lib=lib)
+
+    # the fields of a bibtex as plain values, independent of any library so that it may run in another process
+    # (type, title, author string, author full names, conference string, year string)
+    @classmethod
+    def extractFields(cls, bib_str):
+        a_str = cls.authorParser(bib_str)
+        return (cls.typeParser(bib_str), cls.titleParser(bib_str), a_str, Author.parseFullNames(a_str.lower()),
+                cls.conferenceParser(bib_str), cls.yearParser(bib_str))
+
+    # the Bib of extracted fields, whose authors and conference are resolved in lib if given
+    @classmethod
+    def buildBib(cls, bib_str, fields, lib=None):
+        b_type, title, a_str, full_names, c_str, year = fields
         b = Bib()
         b.bibtex = bib_str
-        b.type = cls.typeParser(bib_str)
-        b.title = cls.titleParser(bib_str)
-        b.author = cls.authorParser(bib_str, lib=lib)
-        b.conference = cls.conferenceParser(bib_str, lib=lib)
-        b.year = cls.yearParser(bib_str)
+        b.type = b_type
+        b.title = title
+        b.author = lib.resolveAuthors(full_names) if lib is not None else a_str
+        b.conference = lib.parseConference(c_str) if lib is not None and len(c_str) > 0 else c_str
+        b.year = year
         return b
     
     @classmethod
@@ -383,6 +522,15 @@ class bibParser:
             result.append(bib)
         return result
 
+    # bibtex of a doi by content negotiation of doi.org
+    @classmethod
+    def queryDoi(cls, doi):
+        header = dict(HEADERS)
+        header['Accept'] = 'application/x-bibtex; charset=utf-8'
+        request = Request(DOI_URL + quote(doi), headers=header)
+        response = urlopen(request, timeout=DOI_TIMEOUT)
+        return response.read().decode('utf8').strip()
+
     @classmethod
     def get_links(cls, html):
         """Return a list of reference links from the html.
@@ -418,13 +566,31 @@ class Paper(object):
         self._tag = []
         self._project = []
 
-        self.comment = ""
+        self._comment = ""  # or BlobRef, loaded once used
         self.hasGithub = False
         self.hasRead = False
         self._rating = 0
 
         self._need_revise = False
 
+    def __setstate__(self, state):
+        # libraries saved by former versions
+        if 'comment' in state:
+            state['_comment'] = state.pop('comment')
+        self.__dict__.update(state)
+
+    @property
+    def comment(self):
+        if isinstance(self._comment, BlobRef):
+            text = self._comment.load()
+            if text is None: return ""
+            self._comment = text
+        return self._comment
+
+    @comment.setter
+    def comment(self, value):
+        self._comment = value
+
     @property
     def bibtex(self):
         return self.bib.bibtex
@@ -496,8 +662,15 @@ class Paper(object):
         self._path = ""
         normed_value = os.path.normpath(value)
         filename = ntpath.basename(normed_value)
-        if filename.endswith(filetypes) and os.path.isfile(os.path.join(application_path, normed_value)):
-            self._path = normed_value
+        if filename.endswith(filetypes):
+            full_path = os.path.join(application_path, normed_value)
+            pending = getattr(path_validation, 'pending', None)
+            if pending is not None:
+                # checked with the other paths when leaving deferredPathValidation
+                pending.append((self, full_path))
+                self._path = normed_value
+            elif stat_cache.isfile(full_path):
+                self._path = normed_value
 
     @property
     def full_path(self):
@@ -568,6 +741,1906 @@ class Paper(object):
             state = 2
         return state
 
+def editDistance(str_a, str_b):
+    # levenshtein distance with a single row
+    if len(str_a) < len(str_b):
+        str_a, str_b = str_b, str_a
+    prev_row = list(range(len(str_b)+1))
+    for i, ca in enumerate(str_a):
+        cur_row = [i+1]
+        for j, cb in enumerate(str_b):
+            cur_row.append(min(prev_row[j+1]+1, cur_row[j]+1, prev_row[j]+(ca != cb)))
+        prev_row = cur_row
+    return prev_row[-1]
+
+class BKTree:
+    # metric tree for near-match queries within an edit distance bound
+    # node: [key, set(values), {distance: child_node}]
+    def __init__(self, distance=editDistance):
+        self.distance = distance
+        self.root = None
+
+    def add(self, key, value):
+        if self.root is None:
+            self.root = [key, set([value]), {}]
+            return
+        node = self.root
+        while True:
+            d = self.distance(key, node[0])
+            if d == 0:
+                node[1].add(value)
+                return
+            if d not in node[2]:
+                node[2][d] = [key, set([value]), {}]
+                return
+            node = node[2][d]
+
+    # nodes are kept (values emptied), so the tree stays a valid metric tree
+    def remove(self, key, value):
+        node = self.root
+        while node is not None:
+            d = self.distance(key, node[0])
+            if d == 0:
+                node[1].discard(value)
+                return
+            node = node[2].get(d)
+
+    # return [(distance, key, values), ...] sorted by distance
+    def search(self, key, max_distance):
+        results = []
+        candidates = [self.root] if self.root is not None else []
+        while candidates:
+            node = candidates.pop()
+            d = self.distance(key, node[0])
+            if d <= max_distance and len(node[1]) > 0:
+                results.append((d, node[0], node[1]))
+            # triangle inequality: only children in [d-max, d+max] can match
+            for child_d in node[2]:
+                if d - max_distance <= child_d <= d + max_distance:
+                    candidates.append(node[2][child_d])
+        results.sort(key=lambda x: x[0])
+        return results
+
+class AhoCorasick:
+    # multi-pattern substring matcher, finds all patterns in a single pass over the text
+    def __init__(self):
+        self.goto = [{}]       # state: {char: next_state}
+        self.fail = [0]
+        self.output = [[]]     # state: [(pattern, value), ...]
+        self.built = True
+
+    def add(self, pattern, value):
+        state = 0
+        for ch in pattern:
+            if ch not in self.goto[state]:
+                self.goto.append({})
+                self.fail.append(0)
+                self.output.append([])
+                self.goto[state][ch] = len(self.goto) - 1
+            state = self.goto[state][ch]
+        self.output[state].append((pattern, value))
+        self.built = False
+
+    def build(self):
+        # bfs over the trie to compute failure links
+        queue = list(self.goto[0].values())
+        for state in queue:
+            self.fail[state] = 0
+        head = 0
+        while head < len(queue):
+            state = queue[head]
+            head += 1
+            for ch, next_state in self.goto[state].items():
+                queue.append(next_state)
+                f = self.fail[state]
+                while f > 0 and ch not in self.goto[f]:
+                    f = self.fail[f]
+                self.fail[next_state] = self.goto[f][ch] if ch in self.goto[f] and self.goto[f][ch] != next_state else 0
+                self.output[next_state] = self.output[next_state] + self.output[self.fail[next_state]]
+        self.built = True
+
+    # return [(start, end, pattern, value), ...] in the order of end position
+    def search(self, text):
+        if not self.built:
+            self.build()
+        matches = []
+        state = 0
+        for i, ch in enumerate(text):
+            while state > 0 and ch not in self.goto[state]:
+                state = self.fail[state]
+            state = self.goto[state].get(ch, 0)
+            for pattern, value in self.output[state]:
+                matches.append((i+1-len(pattern), i+1, pattern, value))
+        return matches
+
+title_norm_re = re.compile(r'[^a-z0-9]+')
+label_word_re = re.compile(r'(?<![^\s,;.-])[^\s,;.-]')
+def normalizeTitle(title):
+    return title_norm_re.sub(' ', title.lower()).strip()
+
+class PrefixIndex:
+    # keys kept sorted, the keys sharing a prefix are a contiguous range found by bisect
+    def __init__(self, items=()):
+        self.postings = {}      # key: set(value, ...)
+        for key, value in items:
+            self.postings.setdefault(key, set()).add(value)
+        self.sorted_keys = sorted(self.postings)
+
+    def add(self, key, value):
+        if key not in self.postings:
+            bisect.insort(self.sorted_keys, key)
+            self.postings[key] = set()
+        self.postings[key].add(value)
+
+    def remove(self, key, value):
+        values = self.postings.get(key)
+        if values is None: return
+        values.discard(value)
+        if len(values) == 0:
+            del self.postings[key]
+            del self.sorted_keys[bisect.bisect_left(self.sorted_keys, key)]
+
+    def keys(self, prefix):
+        start = bisect.bisect_left(self.sorted_keys, prefix)
+        end = bisect.bisect_left(self.sorted_keys, prefix + '\U0010ffff')
+        return self.sorted_keys[start:end]
+
+    # values of all keys starting with prefix, only those within a set if given
+    def values(self, prefix, within=None):
+        result = set()
+        for key in self.keys(prefix):
+            result |= self.postings[key] if within is None else self.postings[key] & within
+        return result
+
+class MinHashLSH:
+    # minhash signatures split into bands, similar sets collide in at least one band bucket
+    def __init__(self, num_perm=MINHASH_PERMUTATIONS, bands=MINHASH_BANDS, seed=1):
+        rng = random.Random(seed)
+        self.masks = [rng.getrandbits(64) for _ in range(num_perm)]
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.buckets = {}       # (band, band_signature): [key, ...]
+
+    @staticmethod
+    def tokenHash(token):
+        return int.from_bytes(hashlib.md5(token.encode('utf8')).digest()[:8], 'little')
+
+    # permutations are simulated by xor-ing the token hashes with random masks
+    def signature(self, tokens):
+        hashes = [self.tokenHash(t) for t in tokens]
+        return [min(map(mask.__xor__, hashes)) for mask in self.masks]
+
+    def add(self, key, tokens):
+        if len(tokens) == 0: return
+        sig = self.signature(tokens)
+        for b in range(self.bands):
+            band_sig = tuple(sig[b*self.rows:(b+1)*self.rows])
+            self.buckets.setdefault((b, band_sig), []).append(key)
+
+    def candidatePairs(self):
+        pairs = set()
+        for keys in self.buckets.values():
+            for i in range(len(keys)):
+                for j in range(i+1, len(keys)):
+                    pairs.add((min(keys[i], keys[j]), max(keys[i], keys[j])))
+        return pairs
+
+def fileDigest(full_path, chunk_size=HASH_CHUNK_SIZE):
+    sha = hashlib.sha256()
+    with open(full_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+class StatCache:
+    # whether files exist, from directory listings or single stats, trusted for ttl seconds
+    # on cloud synced folders a stat may take long, e.g., for a placeholder file not downloaded
+    def __init__(self, ttl=STAT_TTL):
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.files = {}     # full path: (time, is file)
+        self.dirs = {}      # folder: (time, {name: is file})
+
+    def isfile(self, full_path):
+        now = time.time()
+        dir_name, name = os.path.split(full_path)
+        with self.lock:
+            entry = self.files.get(full_path)
+            if entry is not None and now - entry[0] < self.ttl:
+                return entry[1]
+            listing = self.dirs.get(dir_name)
+            # a name missing from a listing is checked again, e.g., in another case
+            if listing is not None and now - listing[0] < self.ttl and listing[1].get(name, False):
+                return True
+        result = os.path.isfile(full_path)
+        with self.lock:
+            self.files[full_path] = (now, result)
+        return result
+
+    # the listing of a folder, e.g., walked by os.walk
+    def addListing(self, dir_name, filenames, dirnames=()):
+        listing = dict([(name, True) for name in filenames])
+        listing.update([(name, False) for name in dirnames])
+        with self.lock:
+            self.dirs[dir_name] = (time.time(), listing)
+
+    def listDir(self, dir_name):
+        listing = {}
+        try:
+            for entry in os.scandir(dir_name):
+                try:
+                    listing[entry.name] = entry.is_file()
+                except OSError:
+                    listing[entry.name] = False
+        except OSError:
+            pass
+        with self.lock:
+            self.dirs[dir_name] = (time.time(), listing)
+
+    # return the set of the existing files of full_paths, listing their folders in parallel
+    def validate(self, full_paths, workers=STAT_WORKERS):
+        now = time.time()
+        with self.lock:
+            stale = set([os.path.dirname(p) for p in full_paths])
+            stale = [d for d in stale if d not in self.dirs or now - self.dirs[d][0] >= self.ttl]
+        if len(stale) > 0:
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                list(executor.map(self.listDir, stale))
+        return set([p for p in full_paths if self.isfile(p)])
+
+    # forget a changed file, or everything
+    def invalidate(self, full_path=None):
+        with self.lock:
+            if full_path is None:
+                self.files.clear()
+                self.dirs.clear()
+            else:
+                self.files.pop(full_path, None)
+                self.dirs.pop(os.path.dirname(full_path), None)
+
+stat_cache = StatCache()
+path_validation = threading.local()
+index_loading = threading.local()
+
+# paths assigned to papers by the current thread are taken at once, and only checked when leaving, in one parallel pass
+# a path of a missing file is cleared then, as if it had been checked when assigned
+# yield [(paper, full path), ...] of the assignments
+@contextlib.contextmanager
+def deferredPathValidation():
+    if getattr(path_validation, 'pending', None) is not None:
+        # nested, checked by the outer one
+        yield path_validation.pending
+        return
+    pending = []
+    path_validation.pending = pending
+    try:
+        yield pending
+    finally:
+        path_validation.pending = None
+        existing = stat_cache.validate([full_path for paper, full_path in pending])
+        for paper, full_path in pending:
+            if full_path not in existing and paper.full_path == full_path:
+                paper._path = ""
+
+class FileHashCache:
+    # content hashes of files keyed by relative path, a file is only rehashed if its size or mtime changed
+    # it is filled by background tasks while the library may be saved
+    def __init__(self):
+        self.entries = {}       # relative path: (size, mtime, sha256)
+        self.lock = threading.Lock()
+
+    def __getstate__(self):
+        with self.lock:
+            return {'entries': dict(self.entries)}
+
+    def __setstate__(self, state):
+        self.entries = state['entries']
+        self.lock = threading.Lock()
+
+    # entries: {relative path: (size, mtime, sha256)}, e.g., loaded from a storage
+    def restore(self, entries):
+        with self.lock:
+            self.entries = dict(entries)
+
+    # return {relative path: sha256} of the existing files, hashing the changed ones in a thread pool
+    # task: Task to report progress and to be cancelled, if any
+    def digestFiles(self, paths, workers=HASH_WORKERS, task=None):
+        digests = {}
+        to_hash = {}
+        for path in paths:
+            try:
+                st = os.stat(os.path.join(application_path, path))
+            except OSError:
+                continue
+            with self.lock:
+                entry = self.entries.get(path)
+            if entry is not None and entry[0] == st.st_size and entry[1] == st.st_mtime:
+                digests[path] = entry[2]
+            else:
+                to_hash[path] = (st.st_size, st.st_mtime)
+
+        if len(to_hash) > 0:
+            hashed_paths = list(to_hash.keys())
+            full_paths = [os.path.join(application_path, p) for p in hashed_paths]
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                for i, (path, digest) in enumerate(zip(hashed_paths, executor.map(fileDigest, full_paths))):
+                    with self.lock:
+                        self.entries[path] = to_hash[path] + (digest,)
+                    digests[path] = digest
+                    if task is not None:
+                        task.checkCancelled()
+                        task.setProgress(i+1, len(hashed_paths), 'hashing files')
+        return digests
+
+    # the last known digest of path, also for files not existing any more
+    def lookup(self, path):
+        with self.lock:
+            entry = self.entries.get(path)
+        return entry[2] if entry is not None else None
+
+    def snapshot(self):
+        with self.lock:
+            return dict(self.entries)
+
+    def prune(self, keep_paths):
+        with self.lock:
+            for path in list(self.entries.keys()):
+                if path not in keep_paths:
+                    del self.entries[path]
+
+# write to a temp file in the same folder, then rename it, so a crash never leaves a truncated file
+def atomicWrite(file_name, data):
+    fd, tmp_name = tempfile.mkstemp(prefix='.' + os.path.basename(file_name) + '.', dir=os.path.dirname(file_name))
+    try:
+        # keep the permission of the replaced file, mkstemp creates it private
+        try:
+            mode = os.stat(file_name).st_mode & 0o777
+        except OSError:
+            mode = 0o644
+        os.chmod(tmp_name, mode)
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_name, file_name)
+    except BaseException:
+        if os.path.exists(tmp_name):
+            os.remove(tmp_name)
+        raise
+
+def fileSignature(file_names):
+    signature = []
+    for file_name in file_names:
+        try:
+            st = os.stat(file_name)
+            signature.append((st.st_mtime, st.st_size))
+        except OSError:
+            signature.append(None)
+    return tuple(signature)
+
+# a paper as plain values, labels instead of the shared category objects
+# blobs: BlobStore to refer the notes and bibtex to, adding the texts to be put into it to new_blobs
+# refs: keep the notes and bibtex not loaded yet as their BlobRef, e.g., to be compared without loading them
+def paperToRecord(paper, blobs=None, new_blobs=None, refs=False):
+    bib = paper.bib
+    if blobs is not None:
+        bibtex, comment = blobs.refer(bib._bibtex, new_blobs), blobs.refer(paper._comment, new_blobs)
+    elif refs:
+        bibtex, comment = bib._bibtex, paper._comment
+    else:
+        bibtex, comment = bib.bibtex, paper.comment
+    return {'id': paper.id, 'path': paper._path, 'title': bib._title, 'first_title_word': bib._first_title_word, 'first_author_name': bib._first_author_name,
+            'bibtex': bibtex, 'type': bib.type, 'year': bib._year, 'conference': bib._conference.label if bib._conference is not None else None,
+            'comment': comment, 'hasRead': paper.hasRead, 'hasGithub': paper.hasGithub, 'need_revise': paper._need_revise, 'rating': paper._rating,
+            'author': [(a.label, a.last_name, a.first_name) for a in bib._author],
+            'tag': [t.label for t in paper._tag], 'project': [p.label for p in paper._project], 'dataset': [d.label for d in paper._dataset]}
+
+# a paper of a record, sharing the categories of lib, to be added by lib.restorePaper
+# blobs: BlobStore of the notes and bibtex referred to by the record
+def paperFromRecord(record, lib, blobs=None):
+    paper = Paper()
+    paper.id = record['id']
+    paper._path = record['path']
+    bib = paper.bib
+    bib._title = record['title']
+    bib._first_title_word = record['first_title_word']
+    bib._first_author_name = record['first_author_name']
+    bib._bibtex = BlobStore.deref(record['bibtex'], blobs)
+    bib.type = record['type']
+    bib._year = record['year']
+    if record['conference'] is not None:
+        bib._conference = lib.addConference(record['conference'])
+
+    for label, last_name, first_name in record['author']:
+        author = lib.authors.get(label)
+        if author is None:
+            author = Author(label)
+            author.label, author.last_name, author.first_name = label, last_name, first_name
+        bib._author.append(author)
+    paper._tag = [lib.tags.get(label, Tag(label)) for label in record['tag']]
+    paper._project = [lib.projects.get(label, Project(label)) for label in record['project']]
+    paper._dataset = [lib.datasets.get(label, Dataset(label)) for label in record['dataset']]
+
+    paper._comment = BlobStore.deref(record['comment'], blobs)
+    paper.hasRead = record['hasRead']
+    paper.hasGithub = record['hasGithub']
+    paper._need_revise = record['need_revise']
+    paper._rating = record['rating']
+    return paper
+
+# a library of paper records and the rest of its state, e.g., read from a storage
+# file_hashes: {relative path: (size, mtime, sha256)}
+def libraryFromRecords(records, conferences, conference_alias, max_paper_id, paper_id_pool, file_hashes, blobs=None):
+    lib = Library()
+    with lib.transaction():
+        for label in conferences:
+            lib.addConference(label)
+        for alias in conference_alias:
+            lib.setConferenceAlias(alias, conference_alias[alias])
+        for record in sorted(records, key=lambda r: r['id']):
+            lib.restorePaper(paperFromRecord(record, lib, blobs))
+        lib.max_paper_id = max(lib.max_paper_id, max_paper_id)
+        lib.paper_id_pool = set([pi for pi in paper_id_pool if pi not in lib.papers])
+        lib.file_hashes.restore(file_hashes)
+    lib.takeDirtyPapers()
+    return lib
+
+# libraries created or loaded by the current thread leave their indexes empty, e.g., to load them from an IndexStore
+# rather than build them, see Library.indexed
+@contextlib.contextmanager
+def deferredIndexes():
+    deferred = getattr(index_loading, 'deferred', False)
+    index_loading.deferred = True
+    try:
+        yield
+    finally:
+        index_loading.deferred = deferred
+
+class BlobRef:
+    # a text in a blob store by its sha256, e.g., the notes of a paper not loaded yet
+    def __init__(self, digest, store):
+        self.digest = digest
+        self.store = store
+
+    # the text, None if missing
+    def load(self):
+        return self.store.get(self.digest)
+
+    # the same text, e.g., of two records compared by a merge
+    def __eq__(self, other):
+        return isinstance(other, BlobRef) and other.digest == self.digest
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return hash(self.digest)
+
+class BlobStore:
+    # content-addressed texts next to the library, a file per sha256 under a folder of its first two digits
+    # a blob is never changed, so an edit writes one small new file and synced computers never conflict on it
+    def __init__(self, dir_name):
+        self.dir_name = dir_name
+        self.digests = {}       # text: sha256 of the texts of the last snapshot
+        self.stored = set()     # sha256 of the blobs known to be in the store
+
+    def path(self, digest):
+        return os.path.join(self.dir_name, digest[:2], digest)
+
+    def get(self, digest):
+        try:
+            with open(self.path(digest), 'rb') as f:
+                return f.read().decode('utf8')
+        except (IOError, OSError):
+            return None
+
+    # blobs: {sha256: text}
+    def put(self, blobs):
+        for digest in blobs:
+            if digest in self.stored: continue
+            file_name = self.path(digest)
+            if not os.path.isfile(file_name):
+                if not os.path.isdir(os.path.dirname(file_name)):
+                    os.makedirs(os.path.dirname(file_name))
+                atomicWrite(file_name, blobs[digest].encode('utf8'))
+            self.stored.add(digest)
+
+    # a note or bibtex in a record: the text, or {'blob': sha256} of one kept in the store, added to blobs
+    def refer(self, value, blobs):
+        if isinstance(value, BlobRef):
+            return {'blob': value.digest}
+        digest = self.digestOf(value, {})
+        if digest is None: return value
+        blobs[digest] = value
+        return {'blob': digest}
+
+    # the value of a note or bibtex in a record, by default in the store next to the program
+    @staticmethod
+    def deref(value, store=None):
+        if isinstance(value, dict):
+            return BlobRef(value['blob'], store if store is not None else BlobStore(lib_blobs_dir))
+        return value
+
+    # the sha256 of a text to be kept in the store, None for a short one kept in the library
+    def digestOf(self, text, digests):
+        if len(text) < BLOB_MIN_SIZE: return None
+        digest = self.digests.get(text)
+        if digest is None:
+            digest = hashlib.sha256(text.encode('utf8')).hexdigest()
+        digests[text] = digest
+        return digest
+
+class BlobPickler(Pickler):
+    # pickles the notes and bibtex of papers as references to the blob store
+    # blobs: {sha256: text} of the texts pickled as references, to be put into the store
+    def __init__(self, f, store, texts):
+        Pickler.__init__(self, f)
+        self.store = store
+        self.texts = texts      # ids of the note and bibtex strings
+        self.digests = {}
+        self.blobs = {}
+
+    def persistent_id(self, obj):
+        if isinstance(obj, BlobRef):
+            return obj.digest
+        if type(obj) is str and id(obj) in self.texts:
+            digest = self.store.digestOf(obj, self.digests)
+            if digest is not None:
+                self.blobs[digest] = obj
+            return digest
+        return None
+
+class BlobUnpickler(Unpickler):
+    def __init__(self, f, store):
+        Unpickler.__init__(self, f)
+        self.store = store
+
+    def persistent_load(self, digest):
+        return BlobRef(digest, self.store)
+
+class LibraryConflict(IOError):
+    # the storage was changed by another computer since it was last read, to be reloaded and merged before the write
+    pass
+
+class LibraryStorage:
+    # where a library is kept
+    # snapshot(lib) is taken on the editing thread, then write(snapshot) may run on another one
+    def __init__(self):
+        self.full = False       # the next snapshot has to hold the whole library
+        self.known_signature = None     # signature of the last load or write
+
+    # changed by others since the last load or write
+    def changed(self):
+        return self.signature() != self.known_signature
+
+    def exists(self):
+        raise NotImplementedError
+
+    # return a Library, or None if there is none
+    def load(self):
+        raise NotImplementedError
+
+    def snapshot(self, lib):
+        raise NotImplementedError
+
+    def write(self, snapshot):
+        raise NotImplementedError
+
+    # one snapshot of two not written yet, the newer taken after the older
+    def merge(self, older, newer):
+        return newer
+
+    # ids of the papers changed in a snapshot, e.g., to be snapshotted again once merged with a reload
+    def snapshotPapers(self, snapshot):
+        raise NotImplementedError
+
+    def save(self, lib):
+        self.write(self.snapshot(lib))
+
+    # changed by each write, e.g., to reload the library
+    def signature(self):
+        raise NotImplementedError
+
+    # paper ids matching a full text query, None if not supported
+    def search(self, query):
+        return None
+
+class PickleStorage(LibraryStorage):
+    # the whole library pickled into one file, replaced by each write
+    # blobs: BlobStore to keep the notes and bibtex in, if any
+    def __init__(self, file_name, blobs=None):
+        LibraryStorage.__init__(self)
+        self.file_name = file_name
+        self.blobs = blobs
+
+    def exists(self):
+        return os.path.isfile(self.file_name)
+
+    def load(self):
+        self.known_signature = self.signature()
+        if not self.exists(): return None
+        with open(self.file_name, 'rb') as f:
+            # notes and bibtex referred to the blob store are loaded once used
+            lib = BlobUnpickler(f, self.blobs if self.blobs is not None else BlobStore(lib_blobs_dir)).load()
+        lib.takeDirtyPapers()
+        return lib
+
+    # (pickle, {sha256: text} to be put into the blob store, ids of the changed papers)
+    def snapshot(self, lib):
+        with lib.exclusive():
+            dirty = lib.takeDirtyPapers()
+            if self.blobs is None:
+                return lib.dumps(), {}, dirty
+            return lib.dumps(self.blobs) + (dirty,)
+
+    def merge(self, older, newer):
+        blobs = dict(older[1])
+        blobs.update(newer[1])
+        return newer[0], blobs, older[2] | newer[2]
+
+    def snapshotPapers(self, snapshot):
+        return set(snapshot[2])
+
+    def write(self, snapshot):
+        # the whole library would replace the one saved by another computer meanwhile
+        if self.known_signature is not None and self.changed():
+            raise LibraryConflict("The library was changed by another computer, to be reloaded first.")
+        data, blobs, dirty = snapshot
+        # the blobs first, the library never refers to a missing one
+        if len(blobs) > 0:
+            self.blobs.put(blobs)
+        atomicWrite(self.file_name, data)
+        self.known_signature = self.signature()
+
+    def signature(self):
+        return fileSignature([self.file_name])
+
+class RecordStorage(LibraryStorage):
+    # a storage written per changed paper, a snapshot holds the records of the papers changed since the last one
+    blobs = None    # BlobStore to keep the notes and bibtex in, if any
+
+    def snapshot(self, lib):
+        # the dirty papers are taken, so no edit may come in between
+        with lib.exclusive():
+            full = self.full
+            dirty = lib.takeDirtyPapers()
+            if full:
+                dirty = set(lib.papers)
+            # None for the removed papers
+            blobs = {}
+            papers = dict([(pi, paperToRecord(lib.papers[pi], self.blobs, blobs) if pi in lib.papers else None) for pi in dirty])
+            snapshot = {'full': full, 'papers': papers, 'blobs': blobs, 'conferences': sorted(lib.conferences), 'conference_alias': dict(lib.conference_alias),
+                        'max_paper_id': lib.max_paper_id, 'paper_id_pool': sorted(lib.paper_id_pool), 'file_hashes': lib.file_hashes.snapshot()}
+        self.full = False
+        return snapshot
+
+    def merge(self, older, newer):
+        papers = dict(older['papers'])
+        papers.update(newer['papers'])
+        blobs = dict(older['blobs'])
+        blobs.update(newer['blobs'])
+        merged = dict(newer)
+        merged['papers'] = papers
+        merged['blobs'] = blobs
+        merged['full'] = older['full'] or newer['full']
+        return merged
+
+    def snapshotPapers(self, snapshot):
+        return set(snapshot['papers'])
+
+# categories of papers in sqlite: (record key, table, link table)
+sqlite_categories = (('tag', 'tags', 'paper_tags'), ('project', 'projects', 'paper_projects'), ('dataset', 'datasets', 'paper_datasets'))
+sqlite_schema = """
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+CREATE TABLE IF NOT EXISTS papers (id INTEGER PRIMARY KEY, path TEXT, title TEXT, first_title_word TEXT, first_author_name TEXT,
+    bibtex TEXT, type INTEGER, year INTEGER, conference TEXT, comment TEXT, has_read INTEGER, has_github INTEGER, need_revise INTEGER, rating INTEGER);
+CREATE INDEX IF NOT EXISTS papers_year ON papers (year);
+CREATE INDEX IF NOT EXISTS papers_conference ON papers (conference);
+CREATE TABLE IF NOT EXISTS authors (id INTEGER PRIMARY KEY, label TEXT UNIQUE, last_name TEXT, first_name TEXT);
+CREATE TABLE IF NOT EXISTS paper_authors (paper_id INTEGER, position INTEGER, category_id INTEGER, PRIMARY KEY (paper_id, position));
+CREATE INDEX IF NOT EXISTS paper_authors_category ON paper_authors (category_id);
+CREATE TABLE IF NOT EXISTS conferences (label TEXT PRIMARY KEY);
+CREATE TABLE IF NOT EXISTS conference_alias (alias TEXT PRIMARY KEY, label TEXT);
+CREATE TABLE IF NOT EXISTS file_hashes (path TEXT PRIMARY KEY, size INTEGER, mtime REAL, digest TEXT);
+""" + "".join(["""
+CREATE TABLE IF NOT EXISTS {0} (id INTEGER PRIMARY KEY, label TEXT UNIQUE);
+CREATE TABLE IF NOT EXISTS {1} (paper_id INTEGER, position INTEGER, category_id INTEGER, PRIMARY KEY (paper_id, position));
+CREATE INDEX IF NOT EXISTS {1}_category ON {1} (category_id);
+""".format(table, link) for key, table, link in sqlite_categories])
+sqlite_fts_schema = "CREATE VIRTUAL TABLE IF NOT EXISTS papers_fts USING fts5 (title, comment, bibtex)"
+
+class SqliteStorage(RecordStorage):
+    # normalized tables written per changed paper in one transaction, with fts5 over title, notes and bibtex if available
+    # fallback: a storage to load from while there is no database yet, e.g., the former pickle
+    def __init__(self, file_name, fallback=None):
+        RecordStorage.__init__(self)
+        self.file_name = file_name
+        self.fallback = fallback
+        self.lock = threading.RLock()
+        self.conn = None
+        self.fts = False
+        self.saved_hashes = None    # file hashes of the last write
+        self.full = True
+
+    def connect(self):
+        if self.conn is None:
+            self.conn = sqlite3.connect(self.file_name, check_same_thread=False)
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.executescript(sqlite_schema)
+            try:
+                self.conn.execute(sqlite_fts_schema)
+                self.fts = True
+            except sqlite3.OperationalError:
+                # sqlite without fts5, searched by like instead
+                self.fts = False
+        return self.conn
+
+    def exists(self):
+        return os.path.isfile(self.file_name)
+
+    def load(self):
+        self.known_signature = self.signature()
+        if not self.exists():
+            return self.fallback.load() if self.fallback is not None else None
+        with self.lock:
+            conn = self.connect()
+            # once connected, which may write the schema into it
+            self.known_signature = self.signature()
+            links = {}      # record key: {paper_id: [label, ...]}
+            links['author'] = self.loadLinks(conn, "SELECT paper_id, label, last_name, first_name FROM paper_authors JOIN authors ON category_id = authors.id ORDER BY paper_id, position")
+            for key, table, link in sqlite_categories:
+                links[key] = self.loadLinks(conn, "SELECT paper_id, label FROM {} JOIN {} ON category_id = {}.id ORDER BY paper_id, position".format(link, table, table), single=True)
+
+            records = []
+            for row in conn.execute("SELECT id, path, title, first_title_word, first_author_name, bibtex, type, year, conference, comment, has_read, has_github, need_revise, rating FROM papers"):
+                record = dict(zip(('id', 'path', 'title', 'first_title_word', 'first_author_name', 'bibtex', 'type', 'year', 'conference', 'comment', 'hasRead', 'hasGithub', 'need_revise', 'rating'), row))
+                for k in ('hasRead', 'hasGithub', 'need_revise'):
+                    record[k] = bool(record[k])
+                for k in links:
+                    record[k] = links[k].get(record['id'], [])
+                records.append(record)
+
+            meta = dict(conn.execute("SELECT key, value FROM meta").fetchall())
+            conferences = [label for (label,) in conn.execute("SELECT label FROM conferences")]
+            conference_alias = dict(conn.execute("SELECT alias, label FROM conference_alias").fetchall())
+            entries = dict([(path, (size, mtime, digest)) for path, size, mtime, digest in conn.execute("SELECT path, size, mtime, digest FROM file_hashes")])
+            lib = libraryFromRecords(records, conferences, conference_alias, int(meta.get('max_paper_id', -1)), json.loads(meta.get('paper_id_pool', '[]')), entries)
+            self.saved_hashes = entries
+            self.full = False
+        return lib
+
+    @staticmethod
+    def loadLinks(conn, sql, single=False):
+        links = {}
+        for row in conn.execute(sql):
+            links.setdefault(row[0], []).append(row[1] if single else tuple(row[1:]))
+        return links
+
+    def write(self, snapshot):
+        with self.lock:
+            # the papers changed by another computer meanwhile would be written over
+            if not snapshot['full'] and self.known_signature is not None and self.changed():
+                raise LibraryConflict("The library was changed by another computer, to be reloaded first.")
+            conn = self.connect()
+            with conn:
+                if snapshot['full']:
+                    for table in ['papers', 'paper_authors', 'authors'] + [t for key, table, link in sqlite_categories for t in (link, table)]:
+                        conn.execute("DELETE FROM " + table)
+                    if self.fts: conn.execute("DELETE FROM papers_fts")
+                for pi in snapshot['papers']:
+                    self.deletePaper(conn, pi)
+                    if snapshot['papers'][pi] is not None:
+                        self.insertPaper(conn, snapshot['papers'][pi])
+
+                conn.execute("DELETE FROM conferences")
+                conn.executemany("INSERT INTO conferences (label) VALUES (?)", [(c,) for c in snapshot['conferences']])
+                conn.execute("DELETE FROM conference_alias")
+                conn.executemany("INSERT INTO conference_alias (alias, label) VALUES (?, ?)", list(snapshot['conference_alias'].items()))
+                meta = {'max_paper_id': str(snapshot['max_paper_id']), 'paper_id_pool': json.dumps(snapshot['paper_id_pool'])}
+                conn.executemany("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", list(meta.items()))
+                if snapshot['file_hashes'] != self.saved_hashes:
+                    conn.execute("DELETE FROM file_hashes")
+                    conn.executemany("INSERT INTO file_hashes (path, size, mtime, digest) VALUES (?, ?, ?, ?)",
+                        [(path,) + tuple(entry) for path, entry in snapshot['file_hashes'].items()])
+            self.saved_hashes = snapshot['file_hashes']
+            # into the database file, so that it alone tells each write
+            conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+            self.known_signature = self.signature()
+
+    def deletePaper(self, conn, paper_id):
+        conn.execute("DELETE FROM papers WHERE id = ?", (paper_id,))
+        if self.fts:
+            conn.execute("DELETE FROM papers_fts WHERE rowid = ?", (paper_id,))
+        for table, link in [('authors', 'paper_authors')] + [(table, link) for key, table, link in sqlite_categories]:
+            category_ids = [r[0] for r in conn.execute("SELECT category_id FROM {} WHERE paper_id = ?".format(link), (paper_id,))]
+            conn.execute("DELETE FROM {} WHERE paper_id = ?".format(link), (paper_id,))
+            # categories of no paper any more
+            for ci in category_ids:
+                if conn.execute("SELECT 1 FROM {} WHERE category_id = ? LIMIT 1".format(link), (ci,)).fetchone() is None:
+                    conn.execute("DELETE FROM {} WHERE id = ?".format(table), (ci,))
+
+    def insertPaper(self, conn, record):
+        conn.execute("INSERT INTO papers (id, path, title, first_title_word, first_author_name, bibtex, type, year, conference, comment, has_read, has_github, need_revise, rating) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (record['id'], record['path'], record['title'], record['first_title_word'], record['first_author_name'], record['bibtex'], record['type'], record['year'],
+             record['conference'], record['comment'], int(record['hasRead']), int(record['hasGithub']), int(record['need_revise']), record['rating']))
+        if self.fts:
+            conn.execute("INSERT INTO papers_fts (rowid, title, comment, bibtex) VALUES (?, ?, ?, ?)", (record['id'], record['title'], record['comment'], record['bibtex']))
+
+        for position, (label, last_name, first_name) in enumerate(record['author']):
+            conn.execute("INSERT OR IGNORE INTO authors (label, last_name, first_name) VALUES (?, ?, ?)", (label, last_name, first_name))
+            author_id = conn.execute("SELECT id FROM authors WHERE label = ?", (label,)).fetchone()[0]
+            conn.execute("INSERT INTO paper_authors (paper_id, position, category_id) VALUES (?, ?, ?)", (record['id'], position, author_id))
+        for key, table, link in sqlite_categories:
+            for position, label in enumerate(record[key]):
+                conn.execute("INSERT OR IGNORE INTO {} (label) VALUES (?)".format(table), (label,))
+                category_id = conn.execute("SELECT id FROM {} WHERE label = ?".format(table), (label,)).fetchone()[0]
+                conn.execute("INSERT INTO {} (paper_id, position, category_id) VALUES (?, ?, ?)".format(link), (record['id'], position, category_id))
+
+    # of the database file only, the -wal file comes and goes with the connections, and each write is checkpointed
+    def signature(self):
+        return fileSignature([self.file_name])
+
+    # pushed down to sqlite: fts5 query syntax, e.g., 'graph AND embed*', or a plain substring without fts5
+    def search(self, query):
+        with self.lock:
+            conn = self.connect()
+            if self.fts:
+                rows = conn.execute("SELECT rowid FROM papers_fts WHERE papers_fts MATCH ?", (query,))
+            else:
+                like = '%' + query + '%'
+                rows = conn.execute("SELECT id FROM papers WHERE title LIKE ? OR comment LIKE ? OR bibtex LIKE ?", (like, like, like))
+            return set([r[0] for r in rows])
+
+class ShardedStorage(RecordStorage):
+    # papers spread over shard files by id, each a json list of records, plus the meta and file hashes files
+    # a save only rewrites the shards of changed papers, so synced machines editing different papers touch different files
+    # a shard is only parsed again if its file changed since it was last read or written
+    # fallback: a storage to load from while there is no shard yet, e.g., the former pickle
+    # blobs: BlobStore to keep the notes and bibtex in, if any
+    META_FILE = 'meta.json'
+    HASHES_FILE = 'file_hashes.json'
+
+    def __init__(self, dir_name, shard_count=SHARD_COUNT, fallback=None, blobs=None):
+        RecordStorage.__init__(self)
+        self.file_name = dir_name
+        self.shard_count = shard_count
+        self.fallback = fallback
+        self.blobs = blobs
+        self.lock = threading.RLock()
+        self.shards = {}        # shard: {paper_id: record}
+        self.signatures = {}    # shard file name: signature it was read or written with
+        self.saved = {}         # meta or hashes file name: content it was read or written with
+        self.full = True
+
+    def shardOf(self, paper_id):
+        # by id rather than e.g. year, a paper never moves to another shard
+        return paper_id % self.shard_count
+
+    def shardFile(self, shard):
+        return 'shard-{:03d}.json'.format(shard)
+
+    def path(self, name):
+        return os.path.join(self.file_name, name)
+
+    def exists(self):
+        return os.path.isfile(self.path(self.META_FILE))
+
+    def readJson(self, name, default):
+        try:
+            with open(self.path(name), 'rb') as f:
+                return json.loads(f.read().decode('utf8'))
+        except (IOError, OSError):
+            return default
+
+    def writeJson(self, name, content):
+        atomicWrite(self.path(name), json.dumps(content, sort_keys=True, indent=1).encode('utf8'))
+
+    # whether the file changed since it was last read or written, e.g., by another computer, to be read again then
+    def refresh(self, name):
+        signature = fileSignature([self.path(name)])
+        if self.signatures.get(name) == signature: return False
+        self.signatures[name] = signature
+        return True
+
+    def readShard(self, shard):
+        self.shards[shard] = dict([(r['id'], r) for r in self.readJson(self.shardFile(shard), [])])
+
+    def readHashes(self):
+        entries = self.readJson(self.HASHES_FILE, {})
+        return dict([(path, tuple(entries[path])) for path in entries])
+
+    def load(self):
+        self.known_signature = self.signature()
+        if not self.exists():
+            return self.fallback.load() if self.fallback is not None else None
+        with self.lock:
+            meta = self.readJson(self.META_FILE, {})
+            # the shard count the shards were written with
+            if meta.get('shard_count', self.shard_count) != self.shard_count:
+                self.shard_count = meta['shard_count']
+                self.shards, self.signatures = {}, {}
+            for shard in range(self.shard_count):
+                if self.refresh(self.shardFile(shard)) or shard not in self.shards:
+                    self.readShard(shard)
+            self.refresh(self.META_FILE)
+            self.refresh(self.HASHES_FILE)
+            entries = self.readHashes()
+            self.saved = {self.META_FILE: meta, self.HASHES_FILE: entries}
+
+            records = [r for shard in self.shards.values() for r in shard.values()]
+            lib = libraryFromRecords(records, meta.get('conferences', []), meta.get('conference_alias', {}), meta.get('max_paper_id', -1),
+                                     meta.get('paper_id_pool', []), entries, self.blobs)
+            self.full = False
+        return lib
+
+    def write(self, snapshot):
+        with self.lock:
+            # the papers of the other shards changed meanwhile are still to be reloaded
+            synced = self.known_signature is None or not self.changed()
+            if not os.path.isdir(self.file_name):
+                os.makedirs(self.file_name)
+            if snapshot['full']:
+                self.shards = dict([(shard, {}) for shard in range(self.shard_count)])
+                changed = set(self.shards)
+            else:
+                changed = set()
+                # the shards changed by another computer meanwhile are read again, only the papers of the snapshot replaced in them
+                for shard in set([self.shardOf(pi) for pi in snapshot['papers']]):
+                    former = self.shards.get(shard, {})
+                    if not self.refresh(self.shardFile(shard)): continue
+                    self.readShard(shard)
+                    # a paper changed by both, or their new paper of the same id, merged by a reload first
+                    # compared as json, a read record has lists for the tuples of a written one
+                    for pi in snapshot['papers']:
+                        if self.shardOf(pi) == shard and json.dumps(self.shards[shard].get(pi), sort_keys=True) != json.dumps(former.get(pi), sort_keys=True):
+                            raise LibraryConflict("Paper {} was changed by another computer.".format(pi))
+            # the blobs first, a shard never refers to a missing one
+            if len(snapshot['blobs']) > 0:
+                self.blobs.put(snapshot['blobs'])
+            for pi in snapshot['papers']:
+                shard = self.shardOf(pi)
+                self.shards.setdefault(shard, {})
+                if snapshot['papers'][pi] is None:
+                    self.shards[shard].pop(pi, None)
+                else:
+                    self.shards[shard][pi] = snapshot['papers'][pi]
+                changed.add(shard)
+            for shard in sorted(changed):
+                name = self.shardFile(shard)
+                self.writeJson(name, [self.shards[shard][pi] for pi in sorted(self.shards[shard])])
+                self.signatures[name] = fileSignature([self.path(name)])
+
+            entries = snapshot['file_hashes']
+            if not snapshot['full'] and self.refresh(self.HASHES_FILE):
+                # theirs kept, ours of the same files taken
+                saved, entries = self.readHashes(), dict(entries)
+                entries.update([(path, saved[path]) for path in saved if path not in entries])
+                self.saved[self.HASHES_FILE] = saved
+            if self.saved.get(self.HASHES_FILE) != entries:
+                self.writeJson(self.HASHES_FILE, entries)
+                self.saved[self.HASHES_FILE] = entries
+                self.signatures[self.HASHES_FILE] = fileSignature([self.path(self.HASHES_FILE)])
+            # last, an interrupted first write leaves no library behind
+            meta = {'shard_count': self.shard_count, 'conferences': snapshot['conferences'], 'conference_alias': snapshot['conference_alias'],
+                    'max_paper_id': snapshot['max_paper_id'], 'paper_id_pool': snapshot['paper_id_pool']}
+            if not snapshot['full'] and self.refresh(self.META_FILE):
+                meta = self.mergeMeta(meta, self.saved.get(self.META_FILE, {}), self.readJson(self.META_FILE, {}))
+            if self.saved.get(self.META_FILE) != meta:
+                self.writeJson(self.META_FILE, meta)
+                self.saved[self.META_FILE] = meta
+                self.signatures[self.META_FILE] = fileSignature([self.path(self.META_FILE)])
+            if synced:
+                self.known_signature = self.signature()
+
+    # ours merged with the meta written by another computer since base, the one as last read or written
+    def mergeMeta(self, ours, base, theirs):
+        self.saved[self.META_FILE] = theirs
+        meta = dict(ours)
+        meta['conferences'] = sorted(set(ours['conferences']) | (set(theirs.get('conferences', [])) - set(base.get('conferences', []))))
+        alias = dict(ours['conference_alias'])
+        alias.update([(k, v) for k, v in theirs.get('conference_alias', {}).items() if k not in base.get('conference_alias', {})])
+        meta['conference_alias'] = alias
+        # the ids taken by them are never given again, so no two papers of both share one
+        meta['max_paper_id'] = max(ours['max_paper_id'], theirs.get('max_paper_id', -1))
+        taken = set(base.get('paper_id_pool', [])) - set(theirs.get('paper_id_pool', []))
+        meta['paper_id_pool'] = [pi for pi in ours['paper_id_pool'] if pi not in taken]
+        return meta
+
+    def signature(self):
+        return fileSignature([self.path(name) for name in [self.META_FILE] + [self.shardFile(shard) for shard in range(self.shard_count)]])
+
+# the storage of the library next to the program: the sqlite database or the shards if any or asked for, otherwise the pickle
+# blobs: keep the notes and bibtex of the pickle or the shards in the blob store, by default if it exists
+def openStorage(backend=None, blobs=None):
+    if blobs is None:
+        blobs = os.path.isdir(lib_blobs_dir)
+    blobs = BlobStore(lib_blobs_dir) if blobs else None
+    if backend is None:
+        if os.path.isfile(lib_db_file):
+            backend = 'sqlite'
+        elif os.path.isdir(lib_shards_dir):
+            backend = 'shards'
+        else:
+            backend = 'pickle'
+    # a former pickle is converted by the first save
+    if backend == 'sqlite':
+        return SqliteStorage(lib_db_file, fallback=PickleStorage(lib_file))
+    elif backend == 'shards':
+        return ShardedStorage(lib_shards_dir, fallback=PickleStorage(lib_file), blobs=blobs)
+    return PickleStorage(lib_file, blobs)
+
+# the storage of a library file: a shards folder (or its meta.json), a sqlite database, or a pickle
+def storageOf(file_name):
+    if os.path.basename(file_name) == ShardedStorage.META_FILE:
+        file_name = os.path.dirname(file_name)
+    # the notes and bibtex in the blob store next to it, if any
+    blobs_dir = os.path.join(libraryFolder(file_name), os.path.basename(lib_blobs_dir))
+    blobs = BlobStore(blobs_dir) if os.path.isdir(blobs_dir) else None
+    if os.path.isdir(file_name):
+        return ShardedStorage(file_name, blobs=blobs)
+    elif file_name.endswith('.db'):
+        return SqliteStorage(file_name)
+    return PickleStorage(file_name, blobs)
+
+# the folder the paper paths of a library file are relative to
+def libraryFolder(file_name):
+    if os.path.basename(file_name) == ShardedStorage.META_FILE:
+        file_name = os.path.dirname(file_name)
+    return os.path.dirname(os.path.abspath(file_name))
+
+# fields of a paper record merged as one, the bib fields stay consistent with each other
+merge_bib_fields = ('title', 'first_title_word', 'first_author_name', 'bibtex', 'type', 'year', 'conference', 'author')
+merge_fields = ('path', 'comment', 'hasRead', 'hasGithub', 'need_revise', 'rating', 'tag', 'project', 'dataset')
+
+class LibraryMerge:
+    # two or three-way merge of library copies, e.g., the conflicted copies made by the cloud sync
+    # papers are matched by path, then by file content, rather than by id, which the id pool reuses
+    # a paper is compared by a fingerprint of its record, only the changed ones are merged field by field
+    # base: the common former copy if any, without it nothing is taken as removed
+    # changed: ids of our papers changed since the base, merged without it, e.g., the base is ours as last saved
+    def __init__(self, ours, theirs, base=None, changed=()):
+        ours_records = self.libraryRecords(ours)
+        theirs_records = self.libraryRecords(theirs)
+        base_records = self.libraryRecords(base) if base is not None else {}
+
+        self.updated = {}       # our paper id: merged record
+        self.added = []         # records of their new papers
+        self.removed = set()    # our paper ids removed by them
+        self.movable = set()    # our changed paper ids of no paper of theirs, e.g., added meanwhile
+        self.conflicts = []     # (path, field) changed differently by both, ours kept
+        with theirs.reading():
+            self.conferences = sorted(theirs.conferences)
+            self.conference_alias = dict(theirs.conference_alias)
+            self.file_hashes = theirs.file_hashes.snapshot()
+
+        to_theirs = self.matchPapers(ours_records, ours.file_hashes, theirs_records, theirs.file_hashes)
+        to_base = self.matchPapers(ours_records, ours.file_hashes, base_records, base.file_hashes) if base is not None else {}
+        theirs_to_base = self.matchPapers(theirs_records, theirs.file_hashes, base_records, base.file_hashes) if base is not None else {}
+
+        for pi in ours_records:
+            mine = ours_records[pi]
+            former = base_records[to_base[pi]] if pi in to_base and pi not in changed else None
+            if pi in to_theirs:
+                other = theirs_records[to_theirs[pi]]
+                if mine['fingerprint'] == other['fingerprint']: continue
+                if former is not None and other['fingerprint'] == former['fingerprint']: continue
+                if former is not None and mine['fingerprint'] == former['fingerprint']:
+                    merged = dict(other)
+                else:
+                    merged = self.mergeRecords(mine, other, former)
+                    # all kept ours
+                    if merged == mine: continue
+                merged['id'] = pi
+                self.updated[pi] = merged
+            elif former is not None:
+                # removed by them, unless changed by us meanwhile
+                if mine['fingerprint'] == former['fingerprint']:
+                    self.removed.add(pi)
+                else:
+                    self.conflicts.append((mine['path'], 'removed'))
+            elif pi in changed:
+                self.movable.add(pi)
+
+        matched = set(to_theirs.values())
+        for pj in theirs_records:
+            if pj in matched: continue
+            other = theirs_records[pj]
+            if pj in theirs_to_base:
+                # removed by us, unless changed by them meanwhile
+                if other['fingerprint'] == base_records[theirs_to_base[pj]]['fingerprint']: continue
+                self.conflicts.append((other['path'], 'removed'))
+            self.added.append(other)
+
+    # {paper id: record with its fingerprint}
+    # the notes and bibtex not loaded yet are kept as their BlobRef, restored as such by paperFromRecord
+    @staticmethod
+    def libraryRecords(lib):
+        records = {}
+        with lib.reading():
+            for pi in lib.papers:
+                record = paperToRecord(lib.papers[pi], refs=True)
+                values = [LibraryMerge.fingerprintValue(record[k]) for k in merge_bib_fields + merge_fields]
+                record['fingerprint'] = hashlib.sha1(json.dumps(values).encode('utf8')).digest()
+                records[pi] = record
+        return records
+
+    # a note or bibtex kept in a blob store by its sha256, the same whether loaded or not
+    @staticmethod
+    def fingerprintValue(value):
+        if isinstance(value, BlobRef):
+            return value.digest
+        if isinstance(value, str) and len(value) >= BLOB_MIN_SIZE:
+            return hashlib.sha256(value.encode('utf8')).hexdigest()
+        return value
+
+    # {id in a: id in b} of the same papers, by path first, then by the file content, then by the title
+    @staticmethod
+    def matchPapers(a_records, a_hashes, b_records, b_hashes):
+        keys = [lambda r, hashes: r['path'],
+                lambda r, hashes: hashes.lookup(r['path']) if len(r['path']) > 0 else None,
+                lambda r, hashes: normalizeTitle(r['title'])]
+        matched = {}
+        b_unmatched = set(b_records)
+        for key in keys:
+            b_keys = {}
+            for pj in b_unmatched:
+                k = key(b_records[pj], b_hashes)
+                if k: b_keys[k] = pj
+            for pi in a_records:
+                if pi in matched: continue
+                k = key(a_records[pi], a_hashes)
+                if k and k in b_keys:
+                    matched[pi] = b_keys.pop(k)
+                    b_unmatched.discard(matched[pi])
+        return matched
+
+    def mergeRecords(self, mine, other, former):
+        merged = dict(mine)
+        groups = [merge_bib_fields] + [(k,) for k in merge_fields]
+        for group in groups:
+            m, o = [mine[k] for k in group], [other[k] for k in group]
+            f = [former[k] for k in group] if former is not None else None
+            if m == o or o == f: continue
+            if m == f:
+                merged.update(zip(group, o))
+                continue
+
+            # changed by both
+            k = group[0]
+            if k in ('tag', 'project', 'dataset'):
+                # the union, less the labels removed by either side
+                dropped = (set(f[0]) - set(m[0])) | (set(f[0]) - set(o[0])) if f is not None else set()
+                merged[k] = [label for label in m[0] + [label for label in o[0] if label not in m[0]] if label not in dropped]
+            elif k == 'comment':
+                # only loaded once changed by both
+                mine_text, other_text = [(v.load() or "") if isinstance(v, BlobRef) else v for v in (m[0], o[0])]
+                merged[k] = (mine_text + '\n' + other_text).strip() if other_text not in mine_text else m[0]
+            elif k in ('hasRead', 'hasGithub'):
+                merged[k] = m[0] or o[0]
+            elif k == 'need_revise':
+                merged[k] = m[0] and o[0]
+            elif k == 'rating':
+                merged[k] = max(m[0], o[0])
+            else:
+                self.conflicts.append((mine['path'], 'bib' if len(group) > 1 else k))
+        return merged
+
+    # apply the merge to the library of ours, return the ids of the added papers and of ours given new ids
+    def apply(self, lib):
+        with lib.transaction():
+            for label in self.conferences:
+                lib.addConference(label)
+            for alias in self.conference_alias:
+                if alias not in lib.conference_alias:
+                    lib.setConferenceAlias(alias, self.conference_alias[alias])
+            entries = dict(self.file_hashes)
+            entries.update(lib.file_hashes.snapshot())
+            lib.file_hashes.restore(entries)
+            return lib.applyRecords(self.updated, self.added, self.removed, self.movable)
+
+    def changed(self):
+        return len(self.updated) + len(self.added) + len(self.removed) > 0
+
+    # limit: the most conflicts listed
+    def summary(self, limit=None):
+        lines = ["{} papers updated, {} added, {} removed.".format(len(self.updated), len(self.added), len(self.removed))]
+        if len(self.conflicts) > 0:
+            lines.append("Kept ours of {} conflicts:".format(len(self.conflicts)))
+            lines += ["{}: {}".format(path, field) for path, field in self.conflicts[:limit]]
+            if limit is not None and len(self.conflicts) > limit:
+                lines.append("...")
+        return '\n'.join(lines)
+
+class IndexStore:
+    # the derived indexes of a library kept in a file next to it, so that a start loads rather than builds them
+    # stamped with the storage signature of the library they were built from, and its number of papers and max id
+    VERSION = 1     # increased once the indexes change
+
+    def __init__(self, file_name):
+        self.file_name = file_name
+        self.saved_stamp = None     # stamp of the indexes in the file, as last loaded or saved
+
+    @classmethod
+    def stamp(cls, signature, lib):
+        return (cls.VERSION, signature, len(lib.papers), lib.max_paper_id)
+
+    # the index state of lib, loaded from the storage of signature, None if missing or stale
+    def load(self, signature, lib):
+        if signature is None or not os.path.isfile(self.file_name): return None
+        try:
+            with open(self.file_name, 'rb') as f:
+                unpickler = Unpickler(f)
+                # the stamp first, a stale state is never read
+                stamp = unpickler.load()
+                if stamp != self.stamp(signature, lib): return None
+                state = unpickler.load()
+        except Exception:
+            # e.g., truncated or written by another version, rebuilt anyway
+            return None
+        self.saved_stamp = stamp
+        return state
+
+    # state: Library.indexState() if not to be taken now
+    def save(self, signature, lib, state=None):
+        stamp = self.stamp(signature, lib)
+        if stamp == self.saved_stamp: return
+        f = BytesIO()
+        pickler = Pickler(f)
+        pickler.dump(stamp)
+        pickler.dump(state if state is not None else lib.indexState())
+        atomicWrite(self.file_name, f.getvalue())
+        self.saved_stamp = stamp
+
+class LibrarySaver:
+    # writes library snapshots to a storage on a worker thread, a newer snapshot is merged into the pending one
+    def __init__(self, storage):
+        self.storage = storage
+        self.cond = threading.Condition()
+        self.pending = None     # snapshot waiting to be written
+        self.writing = False
+        self.error = None       # error of the last write
+        self.unsaved = None     # snapshot of the failed write, merged into the next one
+
+        self.worker = threading.Thread(target=self.run)
+        self.worker.daemon = True
+        self.worker.start()
+
+    # the snapshot is taken on the calling thread under the read lock of the library
+    def save(self, lib):
+        data = self.storage.snapshot(lib)
+        with self.cond:
+            if self.unsaved is not None:
+                data, self.unsaved = self.storage.merge(self.unsaved, data), None
+            self.pending = data if self.pending is None else self.storage.merge(self.pending, data)
+            self.cond.notify_all()
+
+    def busy(self):
+        with self.cond:
+            return self.pending is not None or self.writing
+
+    # ids of the papers of the failed write, e.g., refused to be merged with a reload first
+    def unsavedPapers(self):
+        with self.cond:
+            return self.storage.snapshotPapers(self.unsaved) if self.unsaved is not None else set()
+
+    # forget the failed write, its papers to be snapshotted again, e.g., once merged with a reload
+    def dropUnsaved(self):
+        with self.cond:
+            self.unsaved = None
+
+    # wait until all snapshots are written, return the error if any
+    def flush(self):
+        with self.cond:
+            while self.pending is not None or self.writing:
+                self.cond.wait()
+            return self.error
+
+    def run(self):
+        while True:
+            with self.cond:
+                while self.pending is None:
+                    self.cond.wait()
+                data, self.pending = self.pending, None
+                self.writing = True
+            error = None
+            try:
+                self.storage.write(data)
+            except Exception as e:
+                # e.g., IOError, or a record json can not take, the worker is kept for the next snapshot
+                error = e
+            finally:
+                with self.cond:
+                    if error is not None:
+                        # not lost, written with the next snapshot
+                        if self.pending is not None:
+                            data = self.storage.merge(data, self.pending)
+                            self.pending = None
+                        self.unsaved = data
+                    self.writing = False
+                    self.error = error
+                    self.cond.notify_all()
+
+dblp_record_tags = ('article', 'inproceedings', 'proceedings', 'book', 'incollection', 'phdthesis', 'mastersthesis')
+dblp_homonym_re = re.compile(r'\s+\d{4}$')      # 'Wei Wang 0001'
+arxiv_new_id_re = re.compile(r'^(\d{2})(\d{2})\.\d{4,5}')
+dblp_doi_re = re.compile(r'^https?://(?:dx\.)?doi\.org/(10\..+)$')
+class OfflineIndex:
+    # normalized title: bib fields, built once from a local dblp xml or arxiv metadata jsonl dump
+    BATCH_SIZE = 10000
+
+    # used by background tasks, one at a time
+    def __init__(self, file_name):
+        self.file_name = file_name
+        self.conn = None
+        self.lock = threading.RLock()
+
+    def exists(self):
+        return os.path.isfile(self.file_name)
+
+    def connect(self):
+        if self.conn is None:
+            self.conn = sqlite3.connect(self.file_name, check_same_thread=False)
+            self.conn.execute('CREATE TABLE IF NOT EXISTS metadata (key TEXT PRIMARY KEY, title TEXT, author TEXT, venue TEXT, year INTEGER, type INTEGER, priority INTEGER)')
+            self.conn.execute('CREATE TABLE IF NOT EXISTS dois (doi TEXT PRIMARY KEY, key TEXT)')
+        return self.conn
+
+    def close(self):
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
+
+    @staticmethod
+    def openDump(dump_file):
+        if dump_file.endswith('.gz'):
+            return gzip.open(dump_file, 'rb')
+        return open(dump_file, 'rb')
+
+    # stream the dump with constant memory, return the number of indexed records
+    def build(self, dump_file, task=None):
+        with self.lock:
+            conn = self.connect()
+            name = dump_file[:-3] if dump_file.endswith('.gz') else dump_file
+            records = self.iterDblp(dump_file) if name.endswith('.xml') else self.iterArxiv(dump_file)
+            count = 0
+            batch = []
+            for record, doi in records:
+                batch.append((record, doi))
+                if len(batch) >= self.BATCH_SIZE:
+                    count += self.insert(conn, batch)
+                    batch = []
+                    if task is not None:
+                        task.checkCancelled()
+                        task.setProgress(0, 0, '{} records indexed'.format(count))
+            count += self.insert(conn, batch)
+            return count
+
+    # a published version replaces a preprint of the same title
+    # batch: [(record, doi or None), ...]
+    def insert(self, conn, batch):
+        with conn:
+            conn.executemany('INSERT INTO metadata VALUES (?, ?, ?, ?, ?, ?, ?) ON CONFLICT(key) DO UPDATE SET '
+                'title=excluded.title, author=excluded.author, venue=excluded.venue, year=excluded.year, type=excluded.type, priority=excluded.priority '
+                'WHERE excluded.priority > metadata.priority', [record for record, doi in batch])
+            conn.executemany('INSERT OR REPLACE INTO dois VALUES (?, ?)', [(doi, record[0]) for record, doi in batch if doi is not None])
+        return len(batch)
+
+    @staticmethod
+    def record(title, authors, venue, year, bib_type, priority):
+        title = ' '.join(title.replace('{', '').replace('}', '').split()).rstrip('.')
+        key = normalizeTitle(title)
+        authors = ' and '.join([a.replace('{', '').replace('}', '') for a in authors])
+        return (key, title, authors, venue.replace('{', '').replace('}', ''), year, bib_type, priority)
+
+    def iterDblp(self, dump_file):
+        # dblp.dtd is not loaded, so resolve its character entities, e.g., &uuml;
+        parser = ET.XMLParser()
+        parser.entity.update([(k, chr(name2codepoint[k])) for k in name2codepoint])
+        with self.openDump(dump_file) as fin:
+            context = ET.iterparse(fin, events=('start', 'end'), parser=parser)
+            root = None
+            for event, elem in context:
+                if root is None:
+                    root = elem
+                if event != 'end' or elem.tag not in dblp_record_tags: continue
+
+                title_elem = elem.find('title')
+                year_elem = elem.find('year')
+                if title_elem is not None and year_elem is not None and (year_elem.text or '').isdigit():
+                    authors = [dblp_homonym_re.sub('', a.text or '') for a in elem.findall('author')]
+                    venue_elem = elem.find('booktitle')
+                    bib_type = 0
+                    if venue_elem is None:
+                        venue_elem = elem.find('journal')
+                        bib_type = 1
+                    venue = (venue_elem.text or '') if venue_elem is not None else ''
+                    priority = 0 if venue in ('CoRR', '') else 1
+                    dois = [m.group(1) for m in [dblp_doi_re.match(e.text or '') for e in elem.findall('ee')] if m]
+                    yield self.record(''.join(title_elem.itertext()), authors, venue, int(year_elem.text), bib_type, priority), (dois[0].lower() if len(dois) > 0 else None)
+                # drop parsed records to keep the memory constant
+                root.clear()
+
+    def iterArxiv(self, dump_file):
+        with self.openDump(dump_file) as fin:
+            for line in fin:
+                line = line.strip()
+                if len(line) < 1: continue
+                item = json.loads(line.decode('utf8'))
+                if 'authors_parsed' in item:
+                    authors = [Author.getFullname(' '.join(a[1:]).strip(), a[0]) for a in item['authors_parsed']]
+                else:
+                    authors = Author.parseFormat1(item.get('authors', ''))
+                arxiv_id = item.get('id', '')
+                m = arxiv_new_id_re.match(arxiv_id)
+                if m:
+                    year = 2000 + int(m.group(1))
+                else:
+                    year = int((item.get('update_date') or str(DEFAULT_YEAR))[:4])
+                journal = item.get('journal-ref') or ''
+                venue = journal if len(journal) > 0 else 'arXiv preprint arXiv:' + arxiv_id
+                doi = (item.get('doi') or '').split()
+                yield self.record(item.get('title', ''), authors, venue, year, 1, 1 if len(journal) > 0 else 0), (doi[0].lower() if len(doi) > 0 else None)
+
+    # return {normalized title: bibtex, ...} of the found titles
+    def lookup(self, titles):
+        keys = list(set([normalizeTitle(t) for t in titles]))
+        found = {}
+        with self.lock:
+            conn = self.connect()
+            for i in range(0, len(keys), 500):
+                chunk = keys[i:i+500]
+                rows = conn.execute('SELECT key, title, author, venue, year, type FROM metadata WHERE key IN ({})'.format(','.join('?'*len(chunk))), chunk)
+                for row in rows:
+                    found[row[0]] = self.toBibtex(*row[1:])
+        return found
+
+    # return {doi: bibtex, ...} of the found dois, in lower case
+    def lookupDois(self, dois):
+        dois = list(set([d.lower() for d in dois]))
+        found = {}
+        with self.lock:
+            conn = self.connect()
+            for i in range(0, len(dois), 500):
+                chunk = dois[i:i+500]
+                rows = conn.execute('SELECT dois.doi, title, author, venue, year, type FROM dois JOIN metadata ON dois.key = metadata.key WHERE dois.doi IN ({})'.format(','.join('?'*len(chunk))), chunk)
+                for row in rows:
+                    found[row[0]] = self.toBibtex(*row[1:])
+        return found
+
+    # same format as Bib.__repr__, which bibParser.parse expects
+    @staticmethod
+    def toBibtex(title, author, venue, year, bib_type):
+        first_author = Author.nameParse(Author.parseFormat1(author)[0])[0] if len(author) > 0 else ''
+        m = first_word_re.search(title)
+        cite = first_author.lower() + str(year) + (m.group().lower() if m else '')
+        if bib_type == 1:
+            return "@article{{{},\n  title={{{}}},\n  author={{{}}},\n  journal={{{}}},\n  year={{{}}}\n}}".format(cite, title, author, venue, year)
+        else:
+            return "@inproceedings{{{},\n  title={{{}}},\n  author={{{}}},\n  booktitle={{{}}},\n  year={{{}}}\n}}".format(cite, title, author, venue, year)
+
+pdf_stream_re = re.compile(rb'(\d+)\s+\d+\s+obj\s*<<((?:(?!endobj).)*?)>>\s*stream\r?\n', re.S)
+pdf_length_re = re.compile(rb'/Length\s+(\d+)(?!\s+\d+\s+R)')
+pdf_info_ref_re = re.compile(rb'/Info\s+(\d+)\s+\d+\s+R')
+pdf_xmp_re = re.compile(rb'<x:xmpmeta.*?</x:xmpmeta>', re.S)
+pdf_literal_re = re.compile(rb'\(((?:\\.|[^\\)])*)\)', re.S)
+xmp_title_re = re.compile(r'<dc:title>.*?<rdf:li[^>]*>(.*?)</rdf:li>', re.S)
+xmp_creator_re = re.compile(r'<dc:creator>(.*?)</dc:creator>', re.S)
+xmp_li_re = re.compile(r'<rdf:li[^>]*>(.*?)</rdf:li>', re.S)
+# publication dates only, the creation date of a pdf is mostly when it was downloaded or printed
+xmp_year_re = re.compile(r'(?:prism:publicationDate|prism:coverDate)(?:>|=")((?:19|20)\d\d)')
+doi_re = re.compile(rb'\b(10\.\d{4,9}/[-._;()/:A-Za-z0-9]+[A-Za-z0-9])')
+arxiv_id_re = re.compile(rb'arXiv:\s*((\d\d)\d\d\.\d{4,5})', re.I)
+bad_title_re = re.compile(r'^(microsoft word|untitled)|\.(pdf|dvi|tex|docx?|ps)$', re.I)
+pdf_escapes = {b'n': b'\n', b'r': b'\r', b't': b'\t', b'b': b'\b', b'f': b'\f'}
+
+def decodePdfText(data):
+    if data.startswith(b'\xfe\xff'):
+        return data[2:].decode('utf-16-be', 'ignore').strip()
+    return data.decode('latin-1').strip()
+
+# the value of key in a pdf dictionary, only literal and hex strings
+def pdfValue(obj, key):
+    i = obj.find(key)
+    if i < 0: return None
+    i += len(key)
+    while i < len(obj) and obj[i:i+1].isspace():
+        i += 1
+    if obj[i:i+1] == b'(':
+        out = bytearray()
+        depth = 1
+        i += 1
+        while i < len(obj) and depth > 0:
+            c = obj[i:i+1]
+            if c == b'\\':
+                n = obj[i+1:i+2]
+                if n in pdf_escapes:
+                    out += pdf_escapes[n]
+                    i += 2
+                elif n.isdigit():
+                    j = i + 1
+                    while j < min(i+4, len(obj)) and obj[j:j+1].isdigit():
+                        j += 1
+                    out.append(int(obj[i+1:j], 8) & 0xff)
+                    i = j
+                else:
+                    if n not in (b'\r', b'\n'):
+                        out += n
+                    i += 2
+                continue
+            if c == b'(':
+                depth += 1
+            elif c == b')':
+                depth -= 1
+                if depth == 0: break
+            out += c
+            i += 1
+        return decodePdfText(bytes(out))
+    elif obj[i:i+1] == b'<' and obj[i+1:i+2] != b'<':
+        j = obj.find(b'>', i)
+        hex_str = re.sub(rb'\s', b'', obj[i+1:j])
+        if len(hex_str) % 2 == 1: hex_str += b'0'
+        try:
+            return decodePdfText(bytes.fromhex(hex_str.decode('ascii')))
+        except ValueError:
+            return None
+    return None
+
+# [(dictionary, raw stream), ...] of the stream objects
+def pdfStreams(data):
+    streams = []
+    for m in pdf_stream_re.finditer(data):
+        start = m.end()
+        lm = pdf_length_re.search(m.group(2))
+        end = start + int(lm.group(1)) if lm else data.find(b'endstream', start)
+        if end < start: end = len(data)
+        streams.append((m.group(2), data[start:end]))
+    return streams
+
+def inflate(obj_dict, raw):
+    if b'FlateDecode' not in obj_dict: return raw
+    try:
+        return zlib.decompressobj().decompress(raw)
+    except zlib.error:
+        return b''
+
+# the body of object num, directly in the file or compressed in an object stream
+def pdfObject(data, streams, num):
+    m = re.search(rb'(?<!\d)' + str(num).encode() + rb'\s+\d+\s+obj(.*?)endobj', data, re.S)
+    if m: return m.group(1)
+    for obj_dict, raw in streams:
+        if b'/ObjStm' not in obj_dict: continue
+        fm = re.search(rb'/First\s+(\d+)', obj_dict)
+        if fm is None: continue
+        content = inflate(obj_dict, raw)
+        first = int(fm.group(1))
+        header = content[:first].split()
+        offsets = [(int(header[k]), int(header[k+1])) for k in range(0, len(header)-1, 2)]
+        for k, (obj_num, offset) in enumerate(offsets):
+            if obj_num == num:
+                end = first + offsets[k+1][1] if k+1 < len(offsets) else len(content)
+                return content[first+offset:end]
+    return None
+
+def splitPdfAuthors(a_str):
+    items = re.split(r';|,| and ', a_str) if ';' not in a_str else a_str.split(';')
+    return [item.strip() for item in items if len(item.strip()) > 0]
+
+# title, author, year from the info dictionary and the xmp packet, and doi/arxiv id from the content
+# return {} if nothing found or the file is not a readable pdf
+def readPdfMetadata(full_path):
+    meta = {}
+    try:
+        with open(full_path, 'rb') as f:
+            data = f.read(PDF_MAX_READ)
+        if not data.startswith(b'%PDF'): return meta
+        streams = pdfStreams(data)
+
+        info_refs = pdf_info_ref_re.findall(data)
+        info = pdfObject(data, streams, int(info_refs[-1])) if len(info_refs) > 0 else None
+        if info is not None:
+            title = pdfValue(info, b'/Title')
+            if title and len(title) > 3 and not bad_title_re.search(title):
+                meta['title'] = title
+            author = pdfValue(info, b'/Author')
+            if author:
+                meta['author'] = splitPdfAuthors(author)
+
+        xmp = pdf_xmp_re.search(data)
+        if xmp:
+            xmp = xmp.group().decode('utf8', 'ignore')
+            m = xmp_title_re.search(xmp)
+            if 'title' not in meta and m and len(m.group(1).strip()) > 3 and not bad_title_re.search(m.group(1).strip()):
+                meta['title'] = html.unescape(m.group(1).strip())
+            m = xmp_creator_re.search(xmp)
+            if 'author' not in meta and m:
+                meta['author'] = [html.unescape(a.strip()) for a in xmp_li_re.findall(m.group(1)) if len(a.strip()) > 0]
+            m = xmp_year_re.search(xmp)
+            if m:
+                meta['year'] = int(m.group(1))
+
+        # the first content streams, i.e., the first page, for doi and arxiv id
+        texts = [data[:PDF_MAX_READ >> 4]]
+        for obj_dict, raw in streams:
+            if len(texts) > PDF_MAX_STREAMS: break
+            if b'/Subtype' in obj_dict or b'/Type' in obj_dict or b'/Length1' in obj_dict: continue
+            content = inflate(obj_dict, raw)
+            texts.append(content)
+            texts.append(b''.join(pdf_literal_re.findall(content)))
+        for text in texts:
+            m = arxiv_id_re.search(text)
+            if m and 'arxiv' not in meta:
+                meta['arxiv'] = m.group(1).decode('ascii')
+                meta['year'] = 2000 + int(m.group(2))
+            m = doi_re.search(text)
+            if m and 'doi' not in meta:
+                meta['doi'] = m.group(1).decode('ascii')
+    except Exception:
+        # a broken pdf shall never break the import
+        pass
+    return meta
+
+# yield fn of each item in order, by a process pool from min_items items, otherwise in process
+# to be closed once left early, e.g., with contextlib.closing, so that a cancelled task does not wait for the queued items
+def processMap(fn, items, min_items, max_chunk=POOL_MAX_CHUNK):
+    if len(items) < min_items:
+        for item in items:
+            yield fn(item)
+        return
+    workers = os.cpu_count() or 1
+    executor = None
+    done = 0
+    finished = False
+    try:
+        try:
+            executor = ProcessPoolExecutor(max_workers=workers)
+            for result in executor.map(fn, items, chunksize=max(1, min(max_chunk, len(items)//(4*workers)))):
+                done += 1
+                yield result
+        except (OSError, RuntimeError):
+            # e.g., no process can be started, the rest in process
+            for item in items[done:]:
+                yield fn(item)
+        finished = True
+    finally:
+        if executor is not None:
+            executor.shutdown(wait=finished, cancel_futures=not finished)
+
+# return {full path: metadata} of the pdf files, read by a process pool for many files
+def readPdfMetadataAll(full_paths, task=None):
+    pdf_paths = [p for p in full_paths if p.lower().endswith('.pdf')]
+    metas = {}
+    with contextlib.closing(processMap(readPdfMetadata, pdf_paths, IMPORT_POOL_MIN_FILES)) as results:
+        for path, meta in zip(pdf_paths, results):
+            metas[path] = meta
+            if task is not None:
+                task.checkCancelled()
+                task.setProgress(len(metas), len(pdf_paths), 'reading pdf metadata')
+    return metas
+
+# return [bibParser.extractFields()] of the bibtex strings, extracted by a process pool for many of them
+def extractBibFieldsAll(bib_strs, task=None):
+    fields = []
+    # cheap per bibtex, so sent in larger chunks
+    with contextlib.closing(processMap(bibParser.extractFields, bib_strs, REPARSE_POOL_MIN_PAPERS, max_chunk=REPARSE_PROGRESS_STEP)) as results:
+        for f in results:
+            fields.append(f)
+            if task is not None and len(fields) % REPARSE_PROGRESS_STEP == 0:
+                task.checkCancelled()
+                task.setProgress(len(fields), len(bib_strs), 'parsing bibtex')
+    return fields
+
+class FilePrefetcher:
+    # reads files ahead on a worker thread, e.g., a pdf before it is opened
+    # the kernel is asked to read ahead where supported, and the file is read through so that a cloud placeholder is downloaded
+    # a new request drops what is left of the former one
+    RECENT_FILES = 64
+
+    def __init__(self, budget=PREFETCH_BUDGET, max_read=PREFETCH_MAX_READ):
+        self.budget = budget
+        self.max_read = max_read
+        self.cond = threading.Condition()
+        self.pending = None     # full paths of the last request, the first read first
+        self.request = 0        # increased by each request
+        self.recent = {}        # full path: (size, mtime) of the files read through lately
+
+        self.worker = threading.Thread(target=self.run)
+        self.worker.daemon = True
+        self.worker.start()
+
+    def prefetch(self, full_paths):
+        with self.cond:
+            self.request += 1
+            self.pending = list(full_paths)
+            self.cond.notify_all()
+
+    def run(self):
+        while True:
+            with self.cond:
+                while self.pending is None:
+                    self.cond.wait()
+                full_paths, self.pending = self.pending, None
+                request = self.request
+            budget = self.budget
+            for full_path in full_paths:
+                if budget <= 0 or self.request != request: break
+                budget -= self.readAhead(full_path, min(budget, self.max_read), request)
+
+    # return the bytes read
+    def readAhead(self, full_path, limit, request):
+        read = 0
+        try:
+            st = os.stat(full_path)
+            if self.recent.get(full_path) == (st.st_size, st.st_mtime): return 0
+            with open(full_path, 'rb') as f:
+                if hasattr(os, 'posix_fadvise'):
+                    os.posix_fadvise(f.fileno(), 0, limit, os.POSIX_FADV_WILLNEED)
+                while read < limit:
+                    # dropped for a newer request
+                    if self.request != request: return read
+                    chunk = f.read(min(HASH_CHUNK_SIZE, limit - read))
+                    if not chunk: break
+                    read += len(chunk)
+        except (IOError, OSError):
+            return read
+        # read through
+        if read >= st.st_size:
+            self.recent[full_path] = (st.st_size, st.st_mtime)
+        if len(self.recent) > self.RECENT_FILES:
+            del self.recent[next(iter(self.recent))]
+        return read
+
+class TaskCancelled(Exception):
+    pass
+
+class Task:
+    # handle of a background task, passed to its function to report progress and check cancellation
+    def __init__(self, label):
+        self.label = label
+        self.cancelled = False
+        self.progress = (0, 0, "")      # (current, total, message), total 0 if unknown
+
+    def setProgress(self, current, total, message=""):
+        self.progress = (current, total, message)
+
+    def cancel(self):
+        self.cancelled = True
+
+    def checkCancelled(self):
+        if self.cancelled:
+            raise TaskCancelled()
+
+class TaskRunner:
+    # runs functions on a thread pool, their results are handed back to the gui thread by root.after
+    # on_update(tasks) refreshes the status of the unfinished tasks
+    def __init__(self, root, on_update, workers=TASK_WORKERS):
+        self.root = root
+        self.on_update = on_update
+        self.executor = ThreadPoolExecutor(max_workers=workers)
+        self.tasks = []     # [(task, future, on_done, on_error, on_finish), ...] in the submitted order
+        self.poll_id = None
+
+    # fn(task) runs on a worker, then on_done(result) or on_error(exception) on the gui thread
+    # a cancelled task calls neither, on_finish() is called anyway
+    def submit(self, label, fn, on_done=None, on_error=None, on_finish=None):
+        task = Task(label)
+        future = self.executor.submit(fn, task)
+        self.tasks.append((task, future, on_done, on_error, on_finish))
+        if self.poll_id is None:
+            self.poll_id = self.root.after(TASK_POLL_INTERVAL, self.poll)
+        self.on_update(self.unfinished())
+        return task
+
+    def unfinished(self):
+        return [t[0] for t in self.tasks]
+
+    def poll(self):
+        self.poll_id = None
+        finished = []
+        running = []
+        for t in self.tasks:
+            (finished if t[1].done() else running).append(t)
+        self.tasks = running
+        for task, future, on_done, on_error, on_finish in finished:
+            if on_finish is not None: on_finish()
+            error = TaskCancelled() if future.cancelled() else future.exception()
+            if error is None:
+                if on_done is not None: on_done(future.result())
+            elif not isinstance(error, TaskCancelled) and on_error is not None:
+                on_error(error)
+        self.on_update(self.unfinished())
+        if len(self.tasks) > 0 and self.poll_id is None:
+            self.poll_id = self.root.after(TASK_POLL_INTERVAL, self.poll)
+
+    def cancelAll(self):
+        for task, future, on_done, on_error, on_finish in self.tasks:
+            task.cancel()
+            future.cancel()
+
+    def shutdown(self):
+        self.cancelAll()
+        self.executor.shutdown(wait=False)
+
+class ReadWriteLock:
+    # many readers or one writer, a waiting writer goes before new readers so that it is never starved
+    # reentrant: the writer may read or write again, a reader may read again, but not upgrade to write
+    def __init__(self):
+        self.cond = threading.Condition(threading.Lock())
+        self.readers = {}       # thread id: depth
+        self.writer = None      # thread id
+        self.write_depth = 0
+        self.waiting_writers = 0
+
+    def acquireRead(self):
+        me = threading.get_ident()
+        with self.cond:
+            if self.writer != me and me not in self.readers:
+                while self.writer is not None or self.waiting_writers > 0:
+                    self.cond.wait()
+            self.readers[me] = self.readers.get(me, 0) + 1
+
+    def releaseRead(self):
+        me = threading.get_ident()
+        with self.cond:
+            self.readers[me] -= 1
+            if self.readers[me] == 0:
+                del self.readers[me]
+                if len(self.readers) == 0:
+                    self.cond.notify_all()
+
+    def acquireWrite(self):
+        me = threading.get_ident()
+        with self.cond:
+            if self.writer == me:
+                self.write_depth += 1
+                return
+            if me in self.readers:
+                raise RuntimeError("can not upgrade a read lock to write")
+            self.waiting_writers += 1
+            try:
+                while self.writer is not None or len(self.readers) > 0:
+                    self.cond.wait()
+            finally:
+                self.waiting_writers -= 1
+            self.writer = me
+            self.write_depth = 1
+
+    def releaseWrite(self):
+        with self.cond:
+            self.write_depth -= 1
+            if self.write_depth == 0:
+                self.writer = None
+                self.cond.notify_all()
+
+    @contextlib.contextmanager
+    def reading(self):
+        self.acquireRead()
+        try:
+            yield
+        finally:
+            self.releaseRead()
+
+    @contextlib.contextmanager
+    def writing(self):
+        self.acquireWrite()
+        try:
+            yield
+        finally:
+            self.releaseWrite()
+
+# decorators of Library methods
+def readLocked(method):
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with self.reading():
+            return method(self, *args, **kwargs)
+    return wrapper
+
+def writeLocked(method):
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with self.transaction():
+            return method(self, *args, **kwargs)
+    return wrapper
+
 class Library:
     def __init__(self):
         self._years = {}     # {year:set(paper_id, ...), ...}
@@ -584,6 +2657,250 @@ class Library:
         self._conference_alias = {OTHERS_CONFERENCE:OTHERS_CONFERENCE}
         self.paper_id_pool = set()
         self.max_paper_id = len(self._papers) - 1
+
+        self._file_hashes = FileHashCache()
+
+        self.initRuntime()
+        self.initIndexes()
+
+    # the derived indexes, kept in sync with the papers, see buildIndexes
+    INDEXES = ('_author_index', '_token_index', '_paper_tokens', '_feature_index', '_paper_features', '_stats', '_paper_stats', '_label_indexes')
+
+    # the runtime state and derived indexes are not pickled, they are rebuilt on load
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        for k in self.INDEXES + ('_indexed', '_conference_matcher', '_lock', '_generation', '_dirty_papers'):
+            state.pop(k, None)
+        return state
+
+    def __setstate__(self, state):
+        # libraries saved by former versions
+        state.setdefault('_file_hashes', FileHashCache())
+
+        self.__dict__.update(state)
+        self.initRuntime()
+        self.initIndexes()
+
+    def initRuntime(self):
+        self._lock = ReadWriteLock()
+        self._generation = 0    # increased by each transaction
+        self._dirty_papers = set()  # ids of the papers added, changed or removed since the last save
+
+    # return and forget the dirty papers, e.g., to write them to a storage
+    def takeDirtyPapers(self):
+        with self.exclusive():
+            dirty, self._dirty_papers = self._dirty_papers, set()
+        return dirty
+
+    @readLocked
+    def dirtyPapers(self):
+        return set(self._dirty_papers)
+
+    # mark a paper changed out of the library, e.g., its path or needRevise
+    @writeLocked
+    def touchPaper(self, paper_id):
+        self._dirty_papers.add(paper_id)
+
+    # readers query in parallel, e.g., with lib.reading(): ...
+    def reading(self):
+        return self._lock.reading()
+
+    # readers and writers wait, but unlike a transaction it is no change of the library
+    # e.g., to take a snapshot together with the dirty papers
+    def exclusive(self):
+        return self._lock.writing()
+
+    # a batch of mutations, never seen half done by readers
+    # there is no rollback, a failed transaction keeps what it has changed
+    @contextlib.contextmanager
+    def transaction(self):
+        with self._lock.writing():
+            try:
+                yield self
+            finally:
+                if self._lock.write_depth == 1:
+                    self._generation += 1
+
+    @property
+    def generation(self):
+        return self._generation
+
+    # a consistent snapshot, e.g., to be written by another thread
+    # blobs: BlobStore to keep the notes and bibtex in, then return (pickle, {sha256: text} to be put into it)
+    @readLocked
+    def dumps(self, blobs=None):
+        if blobs is None:
+            return pickle_dumps(self)
+        texts = set()
+        for paper in self._papers.values():
+            texts.add(id(paper._comment))
+            texts.add(id(paper.bib._bibtex))
+        f = BytesIO()
+        pickler = BlobPickler(f, blobs, texts)
+        pickler.dump(self)
+        blobs.digests = pickler.digests
+        return f.getvalue(), pickler.blobs
+
+    def initIndexes(self):
+        self._conference_matcher = None     # AhoCorasick over _conference_alias, built on demand
+        if getattr(index_loading, 'deferred', False):
+            # empty until loaded or built, papers added meanwhile are indexed by then
+            self.loadIndexes(self.computeIndexes(empty=True))
+            self._indexed = False
+        else:
+            self.buildIndexes()
+
+    def buildIndexes(self):
+        self.loadIndexes(self.computeIndexes())
+
+    # the indexes built aside, while the papers are only read
+    # return {attribute: index} of INDEXES, of no paper if empty
+    def computeIndexes(self, empty=False):
+        paper_ids = [] if empty else list(self._papers.keys())
+        state = {}
+        state['_author_index'] = BKTree()     # Author.matchKey(label): set(author_label, ...)
+        for a_label in ([] if empty else self._authors):
+            state['_author_index'].add(Author.matchKey(a_label), a_label)
+
+        paper_tokens = state['_paper_tokens'] = {}     # paper_id: the indexed tokens
+        for pi in paper_ids:
+            paper_tokens[pi] = self.paperTokens(self._papers[pi])
+        state['_token_index'] = PrefixIndex([(token, pi) for pi in paper_tokens for token in paper_tokens[pi]])   # title and author token: set(paper_id, ...)
+
+        paper_features = state['_paper_features'] = {}   # paper_id: the features of related papers
+        feature_index = state['_feature_index'] = {}    # (kind, label): set(paper_id, ...)
+        for pi in paper_ids:
+            paper_features[pi] = self.paperFeatures(self._papers[pi])
+            for f in paper_features[pi]:
+                feature_index.setdefault(f, set()).add(pi)
+
+        paper_stats = state['_paper_stats'] = {}      # paper_id: (the stats keys, hasRead)
+        stats = state['_stats'] = {}            # (filter type, filter name): [papers, read papers]
+        for pi in paper_ids:
+            paper = self._papers[pi]
+            paper_stats[pi] = (self.paperStatKeys(paper), paper.hasRead)
+            self.countStats(stats, paper_stats[pi], 1)
+
+        state['_label_indexes'] = {}    # 'author', 'tag', 'project', 'dataset': PrefixIndex, labelKeys(label): set(label, ...)
+        for name, categories in self.labelCategories():
+            state['_label_indexes'][name] = PrefixIndex([(key, label) for label in ([] if empty else categories) for key in self.labelKeys(label)])
+        return state
+
+    # take the indexes of computeIndexes, or of indexState as persisted
+    def loadIndexes(self, state):
+        for k in self.INDEXES:
+            setattr(self, k, state[k])
+        self._indexed = True
+
+    # {attribute: index} of INDEXES, to be persisted while the library is read
+    @readLocked
+    def indexState(self):
+        return dict([(k, getattr(self, k)) for k in self.INDEXES])
+
+    # the indexes are complete, rather than empty after a deferred load
+    @property
+    def indexed(self):
+        return self._indexed
+
+    # build the indexes of a deferred load while readers query the empty ones and writers wait
+    # then swap them in as a change of the library, built again if it was changed in between
+    # return the index state
+    def rebuildIndexes(self):
+        while True:
+            with self.reading():
+                generation = self._generation
+                state = self.computeIndexes()
+            with self.transaction():
+                if self._generation == generation:
+                    self.loadIndexes(state)
+                    return state
+
+    # categories with completion of their labels
+    def labelCategories(self):
+        return [('author', self._authors), ('tag', self._tags), ('project', self._projects), ('dataset', self._datasets)]
+
+    # a label is completed from its start or any of its words, e.g., 'li, jialun' from 'li' or 'jia'
+    @staticmethod
+    def labelKeys(label):
+        return [label[m.start():] for m in label_word_re.finditer(label)]
+
+    # keep the per paper indexes in sync, called after a paper is added or changed, and before it is removed
+    def _indexPaper(self, paper_id):
+        self._unindexPaper(paper_id)
+        self._dirty_papers.add(paper_id)
+        if not self._indexed: return
+        paper = self._papers[paper_id]
+        self._paper_tokens[paper_id] = self.paperTokens(paper)
+        for token in self._paper_tokens[paper_id]:
+            self._token_index.add(token, paper_id)
+        self._paper_features[paper_id] = self.paperFeatures(paper)
+        for f in self._paper_features[paper_id]:
+            self._feature_index.setdefault(f, set()).add(paper_id)
+        self.countPaper(paper_id, 1)
+
+    def _unindexPaper(self, paper_id):
+        self._dirty_papers.add(paper_id)
+        if not self._indexed: return
+        for token in self._paper_tokens.pop(paper_id, ()):
+            self._token_index.remove(token, paper_id)
+        for f in self._paper_features.pop(paper_id, ()):
+            self._feature_index[f].discard(paper_id)
+            if len(self._feature_index[f]) == 0:
+                del self._feature_index[f]
+        if paper_id in self._paper_stats:
+            self.countPaper(paper_id, -1)
+
+    # add (1) the paper to the stats, or remove (-1) it as it was counted
+    def countPaper(self, paper_id, delta):
+        if delta > 0:
+            paper = self._papers[paper_id]
+            self._paper_stats[paper_id] = (self.paperStatKeys(paper), paper.hasRead)
+        self.countStats(self._stats, self._paper_stats[paper_id] if delta > 0 else self._paper_stats.pop(paper_id), delta)
+
+    @staticmethod
+    def countStats(stats, paper_stats, delta):
+        keys, hasRead = paper_stats
+        for key in keys:
+            counts = stats.setdefault(key, [0, 0])
+            counts[0] += delta
+            if hasRead: counts[1] += delta
+            if counts[0] == 0:
+                del stats[key]
+
+    # the filters a paper is under, as the filters of gui, and ('all', '') for the library
+    def paperStatKeys(self, paper):
+        keys = [('all', '')]
+        if paper.bib.conference is not None:
+            keys.append(('conference', paper.bib.conference.label))
+        if paper.bib.year > DEFAULT_YEAR:
+            keys.append(('year', paper.bib.year))
+        if paper._rating > 0:
+            keys.append(('rating', paper._rating))
+        keys.extend([('author', a.label) for a in paper.bib.author])
+        keys.extend([('tag', t.label) for t in paper._tag])
+        keys.extend([('project', p.label) for p in paper._project])
+        keys.extend([('dataset', d.label) for d in paper._dataset])
+        if paper.hasGithub:
+            keys.append(('others', 'hasGithub'))
+        return set(keys)
+
+    # (kind, label) of the shared information of related papers, the kinds as RELATED_WEIGHTS
+    def paperFeatures(self, paper):
+        features = set([('author', a.label) for a in paper.bib.author])
+        features.update([('tag', t.label) for t in paper._tag])
+        features.update([('project', p.label) for p in paper._project])
+        features.update([('dataset', d.label) for d in paper._dataset])
+        if paper.bib.conference is not None and paper.bib.conference.label != OTHERS_CONFERENCE:
+            features.add(('venue', paper.bib.conference.label))
+        features.update([('term', w) for w in normalizeTitle(paper.title).split() if len(w) > 2])
+        return features
+
+    # words of the title and the authors' names
+    def paperTokens(self, paper):
+        tokens = set(normalizeTitle(paper.title).split())
+        for a in paper.bib.author:
+            tokens.update(normalizeTitle(a.label).split())
+        return tokens
     
     @property
     def papers(self):
@@ -616,31 +2933,42 @@ class Library:
     @property
     def ratings(self):
         return self._ratings
+
+    @property
+    def file_hashes(self):
+        return self._file_hashes
+
+    @property
+    def conference_alias(self):
+        return self._conference_alias
     
+    @readLocked
     def parseConference(self, c_str):
         re_c = None
         if len(c_str) > 0:
+            # the best matched conference comes first
             c_list = self.findConference(c_str.lower())
             re_c = c_list[0]
-            # todo: compute similarity and pick up the similarer one
-            for c in c_list:
-                if c_str == c.label:
-                    re_c = c
         return re_c
     
     def parseAuthors(self, a_str):
+        return self.resolveAuthors(Author.parseFullNames(a_str.lower()))
+
+    # the existing authors of the full names, or new ones
+    @readLocked
+    def resolveAuthors(self, full_names):
         authors = []
-        items = Author.parseAuthorString(a_str.lower())
-        for item in items:
-            last_name, first_name = Author.nameParse(item)
-            full_name = Author.getFullname(first_name, last_name)
+        for full_name in full_names:
             a_list = self.findAuthor(full_name)
+            if len(a_list) == 0:
+                a_list = self.findSimilarAuthor(full_name)
             if len(a_list) > 0:
                 authors.append(a_list[0])
             else:
                 authors.append(Author(full_name))
         return authors
     
+    @readLocked
     def parseTags(self, t_str):
         tags = []
         items = Tag.parse(t_str.lower())
@@ -652,6 +2980,7 @@ class Library:
                 tags.append(Tag(item))
         return tags
     
+    @readLocked
     def parseDatasets(self, d_str):
         datasets = []
         items = Dataset.parse(d_str.lower())
@@ -663,6 +2992,7 @@ class Library:
                 datasets.append(Dataset(item))
         return datasets
     
+    @readLocked
     def parseProjects(self, p_str):
         projects = []
         items = Project.parse(p_str.lower())
@@ -674,6 +3004,7 @@ class Library:
                 projects.append(Project(item))
         return projects
     
+    @writeLocked
     def removePaper(self, paper_id):
         if paper_id in self.papers:
             del_paper = self.papers[paper_id]
@@ -689,35 +3020,47 @@ class Library:
             for a in del_paper.bib.author:
                 a.papers.remove(paper_id)
                 if len(a.papers) == 0:
-                    del self.authors[a.label]
+                    self.unregisterCategory(a, self.authors)
             
             for t in del_paper._tag:
                 t.papers.remove(paper_id)
                 if len(t.papers) == 0:
-                    del self.tags[t.label]
+                    self.unregisterCategory(t, self.tags)
             
             for d in del_paper._dataset:
                 d.papers.remove(paper_id)
                 if len(d.papers) == 0:
-                    del self.datasets[d.label]
+                    self.unregisterCategory(d, self.datasets)
             
             for p in del_paper._project:
                 p.papers.remove(paper_id)
                 if len(p.papers) == 0:
-                    del self.projects[p.label]
+                    self.unregisterCategory(p, self.projects)
             
             if del_paper._rating in self.ratings:
                 self.ratings[del_paper._rating].remove(paper_id)
                 if len(self.ratings[del_paper._rating]) == 0:
                     del self.ratings[del_paper._rating]
 
+            self._unindexPaper(paper_id)
             del self._papers[paper_id]
             self.paper_id_pool.add(paper_id)
     
     # paper: Paper()
+    @writeLocked
     def addPaper(self, paper):
-        
         paper_id = self.generatePaperId()
+        self.insertPaper(paper_id, paper)
+        return paper_id
+
+    # add a paper keeping its id, e.g., loaded from a storage
+    @writeLocked
+    def restorePaper(self, paper):
+        self.paper_id_pool.discard(paper.id)
+        self.max_paper_id = max(self.max_paper_id, paper.id)
+        self.insertPaper(paper.id, paper)
+
+    def insertPaper(self, paper_id, paper):
         paper.id = paper_id
 
         self.addPaperYear(paper_id, paper.bib.year)
@@ -732,8 +3075,7 @@ class Library:
         self.addPaperCategory(paper_id, paper._project, self.projects)
 
         self._papers[paper_id] = paper
-
-        return paper_id
+        self._indexPaper(paper_id)
     
     def addPaperYear(self, paper_id, year):
         if year > DEFAULT_YEAR:
@@ -750,9 +3092,30 @@ class Library:
     def addPaperCategory(self, paper_id, categories, target_categories):
         for c in categories:
             if len(c.papers) == 0:
-                target_categories[c.label] = c
+                self.registerCategory(c, target_categories)
             c.papers.add(paper_id)
+
+    def registerCategory(self, c, categories):
+        categories[c.label] = c
+        if not self._indexed: return
+        if categories is self._authors:
+            self._author_index.add(Author.matchKey(c.label), c.label)
+        for name, items in self.labelCategories():
+            if categories is items:
+                for key in self.labelKeys(c.label):
+                    self._label_indexes[name].add(key, c.label)
+
+    def unregisterCategory(self, c, categories):
+        del categories[c.label]
+        if not self._indexed: return
+        if categories is self._authors:
+            self._author_index.remove(Author.matchKey(c.label), c.label)
+        for name, items in self.labelCategories():
+            if categories is items:
+                for key in self.labelKeys(c.label):
+                    self._label_indexes[name].remove(key, c.label)
     
+    @writeLocked
     def revisePaperBib(self, paper_id, bib):
         hasRevised = False
         target_paper = self.papers[paper_id]
@@ -788,8 +3151,11 @@ class Library:
         if target_paper.author != Author.guiString(bib.author):
             target_paper.bib.author = self.revisePaperCategory(paper_id, bib.author, target_paper.bib.author, self.authors)
             hasRevised = True
+
+        self._indexPaper(paper_id)
         return hasRevised
     
+    @writeLocked
     def revisePaper(self, paper_id, paper):
         hasRevised = False
         target_paper = self.papers[paper_id]
@@ -822,27 +3188,77 @@ class Library:
             hasRevised = True
         
         if target_paper.rating != paper.rating:
-            if target_paper._rating in self.ratings:
-                self.ratings[target_paper._rating].remove(paper_id)
-                if len(self.ratings[target_paper._rating]) == 0:
-                    del self.ratings[target_paper._rating]
-            self.addPaperRating(paper_id, paper._rating)
-            target_paper._rating = paper._rating
+            self.setPaperRating(paper_id, paper._rating)
             hasRevised = True
+
+        self._indexPaper(paper_id)
         return hasRevised
+
+    def setPaperRating(self, paper_id, rating):
+        target_paper = self.papers[paper_id]
+        if target_paper._rating in self.ratings:
+            self.ratings[target_paper._rating].remove(paper_id)
+            if len(self.ratings[target_paper._rating]) == 0:
+                del self.ratings[target_paper._rating]
+        self.addPaperRating(paper_id, rating)
+        target_paper._rating = rating
+
+    # edit many papers at once, e.g., retag the selected papers
+    # add: {'tag': [Tag(), ...], 'project': [Project(), ...], 'dataset': [Dataset(), ...]}, e.g., by parseTags
+    # remove: {'tag': set(label, ...), ...}, rating and hasRead: None to keep them
+    # return the ids of the revised papers
+    @writeLocked
+    def editPapers(self, paper_ids, add=None, remove=None, rating=None, hasRead=None):
+        add = add if add is not None else {}
+        remove = remove if remove is not None else {}
+        fields = (('tag', '_tag', self._tags), ('project', '_project', self._projects), ('dataset', '_dataset', self._datasets))
+        revised = set()
+        for paper_id in paper_ids:
+            paper = self.papers[paper_id]
+            for name, attr, categories in fields:
+                old = getattr(paper, attr)
+                new = [c for c in old if c.label not in remove.get(name, ())]
+                for c in add.get(name, []):
+                    if c.label not in [n.label for n in new]:
+                        new.append(c)
+                if [c.label for c in new] != [c.label for c in old]:
+                    setattr(paper, attr, self.revisePaperCategory(paper_id, new, old, categories))
+                    revised.add(paper_id)
+            if rating is not None and paper._rating != rating:
+                self.setPaperRating(paper_id, rating)
+                revised.add(paper_id)
+            if hasRead is not None and paper.hasRead != hasRead:
+                paper.hasRead = hasRead
+                revised.add(paper_id)
+        for paper_id in revised:
+            self._indexPaper(paper_id)
+        return revised
+
+    @writeLocked
+    def removePapers(self, paper_ids):
+        for paper_id in paper_ids:
+            self.removePaper(paper_id)
     
     def revisePaperCategory(self, paper_id, source_category, target_category, categories):
         for c in source_category:
             c.papers.add(paper_id)
             if c.label not in categories:
-                categories[c.label] = c
+                self.registerCategory(c, categories)
         for c in target_category:
             if c not in source_category:
                 c.papers.remove(paper_id)
                 if len(c.papers) == 0:
-                    del categories[c.label]
+                    self.unregisterCategory(c, categories)
         return source_category
         
+    # the conference of label, added if it is new
+    @writeLocked
+    def addConference(self, label):
+        if label not in self._conferences:
+            self._conferences[label] = Conference(label)
+        return self._conferences[label]
+
+    @writeLocked
     def setOtherConference(self, paper_id, paper):
         paper.bib._conference = self._conferences[OTHERS_CONFERENCE]
         self._conferences[OTHERS_CONFERENCE].papers.add(paper_id)
@@ -874,6 +3290,85 @@ class Library:
                 return True
         return False
     
+    # word unigrams and bigrams of the normalized title, plus the authors' names regardless of their order
+    def paperShingles(self, paper):
+        words = normalizeTitle(paper.title).split()
+        shingles = set(words)
+        shingles.update([words[i] + ' ' + words[i+1] for i in range(len(words)-1)])
+        shingles.update(['author:' + ','.join(sorted(Author.matchKey(a.label).split(','))) for a in paper.bib.author])
+        return shingles
+
+    # near-duplicate pairs via minhash lsh, verified by the exact jaccard similarity
+    # return [(similarity, paper_id, paper_id), ...], the most similar first
+    @readLocked
+    def findNearDuplicatePapers(self, threshold=DUPLICATE_THRESHOLD):
+        lsh = MinHashLSH()
+        shingles = {}
+        for pi in self.papers:
+            shingles[pi] = self.paperShingles(self.papers[pi])
+            lsh.add(pi, shingles[pi])
+
+        pairs = []
+        for pi, pj in lsh.candidatePairs():
+            sim = len(shingles[pi] & shingles[pj]) / float(len(shingles[pi] | shingles[pj]))
+            if sim >= threshold:
+                pairs.append((sim, pi, pj))
+        pairs.sort(key=lambda x: (-x[0], x[1], x[2]))
+        return pairs
+
+    # replace, add and remove papers by their records, e.g., of a merge
+    # updated: {paper_id: record}, added: [record, ...] kept at their ids if free, removed: paper ids
+    # movable: ids of our papers not saved yet, given new ones for the added papers of the same ids, e.g., added on two computers at once
+    # return the ids of the added papers and of the ones given new ids
+    @writeLocked
+    def applyRecords(self, updated=None, added=(), removed=(), movable=()):
+        updated = updated if updated is not None else {}
+        for paper_id in removed:
+            self.removePaper(paper_id)
+        for paper_id in updated:
+            self.removePaper(paper_id)
+            record = dict(updated[paper_id])
+            record['id'] = paper_id
+            self.restorePaper(paperFromRecord(record, self))
+        papers = [paperFromRecord(record, self) for record in added]
+        moved = []
+        for paper in papers:
+            if paper.id in movable and paper.id in self.papers:
+                moved.append(self.papers[paper.id])
+                self.removePaper(paper.id)
+        # the new ids once all added ones are kept, none of them given twice
+        taken = [paper for paper in papers if paper.id in self.papers]
+        for paper in papers:
+            if paper.id not in self.papers:
+                self.restorePaper(paper)
+        for paper in moved + taken:
+            self.addPaper(paper)
+        return [paper.id for paper in papers + moved]
+
+    # keep one paper, take over the optional information of the other, and remove the other
+    @writeLocked
+    def mergePapers(self, keep_id, drop_id):
+        keep = self.papers[keep_id]
+        drop = self.papers[drop_id]
+
+        merged = Paper()
+        merged.bib = keep.bib
+        merged._path = keep._path
+        merged._tag = keep._tag + [t for t in drop._tag if t not in keep._tag]
+        merged._dataset = keep._dataset + [d for d in drop._dataset if d not in keep._dataset]
+        merged._project = keep._project + [p for p in drop._project if p not in keep._project]
+        if len(drop.comment) > 0 and drop.comment not in keep.comment:
+            merged.comment = (keep.comment + '\n' + drop.comment).strip()
+        else:
+            merged.comment = keep.comment
+        merged.hasRead = keep.hasRead or drop.hasRead
+        merged.hasGithub = keep.hasGithub or drop.hasGithub
+        merged._rating = max(keep._rating, drop._rating)
+
+        self.revisePaper(keep_id, merged)
+        self.removePaper(drop_id)
+
+    @readLocked
     def searchDuplicatePaper(self, paper):
         for pi in self.papers:
             pi_path = self.papers[pi].path
@@ -881,7 +3376,22 @@ class Library:
                 return pi
         return -1
 
+    # a query paper for findPaper from {field: string}, the same as the inputs of gui
+    @readLocked
+    def buildQuery(self, fields):
+        paper = Paper()
+        paper.title = fields.get('title', '').strip()
+        paper.author = self.parseAuthors(fields.get('author', '').strip())
+        c_str = fields.get('conference', '').strip().lower()
+        paper.conference = self.conferences[c_str] if c_str in self.conferences else None
+        paper.year = fields.get('year', '').strip()
+        paper.tag = self.parseTags(fields.get('tag', '').strip())
+        paper.project = self.parseProjects(fields.get('project', '').strip())
+        paper.dataset = self.parseDatasets(fields.get('dataset', '').strip())
+        return paper
+
     # todo: better fuzzy comment
+    @readLocked
     def findPaper(self, paper, target_paper_ids=None, support_fuzzy=False, fuzzy_window=0):
         
         papers_list = []
@@ -942,6 +3452,7 @@ class Library:
                 re_papers = papers_list[0].union(*papers_list[1:])
         return re_papers
 
+    @readLocked
     def findYear(self, year, fuzzy_window=0):
         papers = set()
         year = int(year)
@@ -955,6 +3466,7 @@ class Library:
                     papers |= self.years[year-i-1]
         return papers
     
+    @readLocked
     def findRating(self, rating):
         papers = set()
         rating = int(rating)
@@ -962,18 +3474,92 @@ class Library:
             papers |= self.ratings[rating]
         return papers
     
+    @readLocked
     def findUnread(self):
         papers = [pi for pi in self.papers if not self.papers[pi].hasRead]
         return set(papers)
     
+    @readLocked
     def findGithub(self):
         papers = [pi for pi in self.papers if self.papers[pi].hasGithub]
         return set(papers)
     
+    @readLocked
     def findToRevise(self):
         papers = [pi for pi in self.papers if self.papers[pi]._need_revise]
         return set(papers)
 
+    # the papers sharing the most weighted information with paper_id, return [(similarity, paper_id), ...]
+    # cosine of sparse binary vectors, each feature weighted by its kind and idf
+    # only the papers sharing a feature with it are scored, found by the feature postings
+    @readLocked
+    def findRelatedPapers(self, paper_id, limit=RELATED_LIMIT):
+        n = float(len(self._papers))
+        weight = lambda f: RELATED_WEIGHTS[f[0]] * math.log(1.0 + n / len(self._feature_index[f]))
+        norm = lambda pi: math.sqrt(sum([weight(f) ** 2 for f in self._paper_features[pi]]))
+
+        if paper_id not in self._paper_features: return []
+        features = self._paper_features[paper_id]
+        scores = {}
+        # the rare features first, they bring the candidates
+        for f in sorted(features, key=lambda f: len(self._feature_index[f])):
+            w = weight(f) ** 2
+            postings = self._feature_index[f]
+            if len(postings) <= RELATED_MAX_POSTINGS:
+                for pi in postings:
+                    scores[pi] = scores.get(pi, 0.0) + w
+            else:
+                for pi in scores:
+                    if pi in postings:
+                        scores[pi] += w
+        scores.pop(paper_id, None)
+        if len(scores) == 0: return []
+
+        paper_norm = norm(paper_id)
+        return heapq.nlargest(limit, [(scores[pi] / (paper_norm * norm(pi)), pi) for pi in scores])
+
+    # (number of papers, number of read papers) under a filter, e.g., ('tag', 'nlp'), ('all', '') for the library
+    # needRevise is not counted, it is set out of the library
+    @readLocked
+    def filterStats(self, filter_type, filter_name):
+        if (filter_type, filter_name) == ('others', 'unRead'):
+            total, read = self._stats.get(('all', ''), (0, 0))
+            return (total - read, 0)
+        total, read = self._stats.get((filter_type, filter_name), (0, 0))
+        return (total, read)
+
+    # {filter type: [(filter name, papers, read papers), ...]}, the most papers first
+    @readLocked
+    def libraryStats(self):
+        stats = {}
+        for (filter_type, filter_name), (total, read) in self._stats.items():
+            if filter_type == 'all': continue
+            stats.setdefault(filter_type, []).append((filter_name, total, read))
+        for filter_type in stats:
+            stats[filter_type].sort(key=lambda x: (-x[1], str(x[0])))
+        return stats
+
+    # labels of a category ('author', 'tag', 'project' or 'dataset') completing prefix, the most used first
+    @readLocked
+    def completeLabel(self, name, prefix, limit=COMPLETION_LIMIT):
+        prefix = prefix.strip().lower()
+        if len(prefix) < 1: return []
+        categories = dict(self.labelCategories())[name]
+        labels = self._label_indexes[name].values(prefix)
+        return heapq.nsmallest(limit, labels, key=lambda label: (-len(categories[label].papers), label))
+
+    # papers whose title or author words start with each word of query, e.g., 'deep lea' matches 'deep learning'
+    # candidates: a former result to refine, e.g., of the query before the last keystroke
+    @readLocked
+    def searchTokens(self, query, candidates=None):
+        papers = None if candidates is None else set(candidates)
+        # the longest, i.e., most selective, first
+        for token in sorted(set(normalizeTitle(query).split()), key=len, reverse=True):
+            if papers is not None and len(papers) == 0: break
+            papers = self._token_index.values(token, within=papers)
+        return papers if papers is not None else set(self._papers)
+
+    @readLocked
     def findTitle(self, t_str, target_paper_ids=None, support_fuzzy=False):
         papers = set()
         if target_paper_ids is None:
@@ -983,25 +3569,49 @@ class Library:
                 papers.add(pi)
         return papers
 
+    @writeLocked
+    def setConferenceAlias(self, alias, c_name):
+        self._conference_alias[alias] = c_name
+        self._conference_matcher = None
+
+    def getConferenceMatcher(self):
+        matcher = self._conference_matcher
+        if matcher is None:
+            # built aside, concurrent readers never see it half built
+            matcher = AhoCorasick()
+            for c_name in self._conference_alias:
+                matcher.add(c_name, self._conference_alias[c_name])
+            matcher.build()
+            self._conference_matcher = matcher
+        return matcher
+
     def getConferenceName(self, c_str):
         if len(c_str) > 0:
             return self._conference_alias[c_str] if c_str in self._conference_alias else OTHERS_CONFERENCE
         else: return c_str
     
+    @readLocked
     def findConference(self, c_str, support_fuzzy=False):
         conferences = []
         if c_str != OTHERS_CONFERENCE and len(c_str) > 0:
-            for c_name in self._conference_alias:
-                if c_str == c_name or c_name in c_str :
-                    conferences.append(self.conferences[self._conference_alias[c_name]])
-                elif support_fuzzy and self.similarity(c_str, c_name, support_fuzzy=support_fuzzy):
-                    conferences.append(self.conferences[self._conference_alias[c_name]])
+            # all aliases contained in c_str, ranked by: exact match, longer alias, earlier position
+            matches = self.getConferenceMatcher().search(c_str)
+            matches.sort(key=lambda m: (m[2] != c_str, -len(m[2]), m[0]))
+            for start, end, c_name, c_label in matches:
+                if self.conferences[c_label] not in conferences:
+                    conferences.append(self.conferences[c_label])
+            if support_fuzzy:
+                for c_name in self._conference_alias:
+                    c = self.conferences[self._conference_alias[c_name]]
+                    if c not in conferences and self.similarity(c_str, c_name, support_fuzzy=support_fuzzy):
+                        conferences.append(c)
             return conferences if len(conferences) > 0 else [self._conferences[OTHERS_CONFERENCE]]
         elif c_str == OTHERS_CONFERENCE:
             return [self._conferences[OTHERS_CONFERENCE]]
         else:
             return [None]
     
+    @readLocked
     def findItems(self, key_words, item_dict, support_fuzzy=False):
         items = []
         if key_words in item_dict:
@@ -1013,15 +3623,52 @@ class Library:
                     items.append(item_dict[item_str]) 
         return items
     
+    @readLocked
     def findAuthor(self, a_str, support_fuzzy=False):
-        return self.findItems(a_str, self._authors, support_fuzzy=support_fuzzy)
+        authors = self.findItems(a_str, self._authors, support_fuzzy=support_fuzzy)
+        if support_fuzzy:
+            authors.extend([a for a in self.findSimilarAuthor(a_str, max_distance=AUTHOR_MAX_DISTANCE) if a not in authors])
+        return authors
+
+    # near-match authors via the bk-tree, closest first
+    # max_distance=None: strict policy for parsing, i.e., a unique closest author of a long enough label
+    @readLocked
+    def findSimilarAuthor(self, a_str, max_distance=None):
+        key = Author.matchKey(a_str)
+        strict = max_distance is None
+        if strict:
+            if len(key) < AUTHOR_FUZZY_MIN_LENGTH: 
+                max_distance = 0
+            else:
+                max_distance = AUTHOR_MAX_DISTANCE
+        
+        matches = self._author_index.search(key, max_distance)
+        if strict and len(matches) > 0:
+            closest = [m for m in matches if m[0] == matches[0][0]]
+            if len(closest) > 1:
+                # ambiguous, keep it as a new author
+                return []
+            matches = closest
+        
+        authors = []
+        for d, m_key, labels in matches:
+            # labels sharing a key, e.g., 'li, jialun' and 'li, jia-lun', the most used first
+            m_authors = [self._authors[label] for label in labels if label in self._authors]
+            m_authors.sort(key=lambda a: (-len(a.papers), a.label))
+            authors.extend(m_authors)
+        if strict:
+            authors = authors[:1]
+        return authors
     
+    @readLocked
     def findDataset(self, d_str, support_fuzzy=False):
         return self.findItems(d_str, self._datasets, support_fuzzy=support_fuzzy)
     
+    @readLocked
     def findTag(self, t_str, support_fuzzy=False):
         return self.findItems(t_str, self._tags, support_fuzzy=support_fuzzy)
 
+    @readLocked
     def findProject(self, p_str, support_fuzzy=False):
         return self.findItems(p_str, self._projects, support_fuzzy=support_fuzzy)
 
@@ -1053,18 +3700,287 @@ class MyDialog(Toplevel):
         self.wait_window()
         return self.re
 
+class DuplicateDialog(Toplevel):
+    # pairs: [(similarity, paper_id, paper_id), ...], resolve: callback(keep_id, drop_id)
+    def __init__(self, parent, lib, pairs, resolve):
+        Toplevel.__init__(self, parent)
+        self.title("Near-duplicate papers")
+        self.lib = lib
+        self.resolve = resolve
+
+        self.label = Label(self, text="Found the following near-duplicate papers, keep one of them (its tags, projects, datasets and notes are merged) or close.")
+        self.pairs_tree = ttk.Treeview(self, columns=('Sim', 'First', 'Second'), show='headings', selectmode='browse')
+        self.pairs_tree.heading('Sim', text='Sim')
+        self.pairs_tree.heading('First', text='First')
+        self.pairs_tree.heading('Second', text='Second')
+        self.pairs_tree.column('Sim', width=60, stretch=0, anchor='center')
+        self.pairs_tree.column('First', width=400, stretch=1, anchor='w')
+        self.pairs_tree.column('Second', width=400, stretch=1, anchor='w')
+        self.pair_to_tree = {}
+        for sim, pi, pj in pairs:
+            values = ('{:.2f}'.format(sim), self.describe(pi), self.describe(pj))
+            self.pair_to_tree[(pi, pj)] = self.pairs_tree.insert('', 'end', values=values)
+
+        self.keep_first_button = ttk.Button(self, text="Keep First", command=lambda: self.keep(0))
+        self.keep_second_button = ttk.Button(self, text="Keep Second", command=lambda: self.keep(1))
+        self.close_button = ttk.Button(self, text="Close", command=self.destroy)
+
+        self.label.pack(side="top", fill="x")
+        self.pairs_tree.pack(side="top", fill="both", expand=True)
+        self.keep_first_button.pack(side="left", anchor="e", padx=4, pady=4)
+        self.keep_second_button.pack(side="left", padx=4, pady=4)
+        self.close_button.pack(side="left")
+
+        self.transient(parent)
+
+    def describe(self, paper_id):
+        paper = self.lib.papers[paper_id]
+        return "{} | {} | {} | {}".format(paper.title, paper.conference, paper.year, paper.path)
+
+    def keep(self, which):
+        tree_id = self.pairs_tree.focus()
+        pair = [p for p in self.pair_to_tree if self.pair_to_tree[p] == tree_id]
+        if len(pair) < 1: return
+        keep_id, drop_id = pair[0] if which == 0 else pair[0][::-1]
+        self.resolve(keep_id, drop_id)
+        # drop every pair involving the removed paper
+        for p in list(self.pair_to_tree):
+            if drop_id in p:
+                self.pairs_tree.delete(self.pair_to_tree[p])
+                del self.pair_to_tree[p]
+
+    def show(self):
+        self.grab_set()
+        self.wait_window()
+
+class BatchEditDialog(Toplevel):
+    # the changes of the selected papers, show() returns them or None if cancelled
+    def __init__(self, parent, count):
+        Toplevel.__init__(self, parent)
+        self.title("Edit {} papers".format(count))
+        self.re = None
+
+        self.label = Label(self, text="Items separated by ';', empty ones are unchanged.")
+        self.inputs = {}
+        for row, (key, text) in enumerate([('add_tag', 'Add Tags:'), ('remove_tag', 'Remove Tags:'), ('add_project', 'Add Projects:'), ('remove_project', 'Remove Projects:'), ('add_dataset', 'Add Datasets:'), ('remove_dataset', 'Remove Datasets:')]):
+            ttk.Label(self, text=text).grid(row=row+1, column=0, sticky=E)
+            self.inputs[key] = ttk.Entry(self, width=40)
+            self.inputs[key].grid(row=row+1, column=1, columnspan=2, sticky=(W,E))
+
+        ttk.Label(self, text='Rating:').grid(row=7, column=0, sticky=E)
+        self.rating = ttk.Combobox(self, values=['unchanged'] + [str(r) for r in range(MAX_RATING+1)], state='readonly', width=10)
+        self.rating.current(0)
+        self.rating.grid(row=7, column=1, sticky=W)
+
+        ttk.Label(self, text='Read:').grid(row=8, column=0, sticky=E)
+        self.read = ttk.Combobox(self, values=['unchanged', 'read', 'unread'], state='readonly', width=10)
+        self.read.current(0)
+        self.read.grid(row=8, column=1, sticky=W)
+
+        self.apply_button = ttk.Button(self, text="Apply", command=self.apply)
+        self.cancel_button = ttk.Button(self, text="Cancel", command=self.destroy)
+
+        self.label.grid(row=0, column=0, columnspan=3, sticky=W)
+        self.apply_button.grid(row=9, column=1, sticky=E, padx=4, pady=4)
+        self.cancel_button.grid(row=9, column=2, sticky=W, padx=4, pady=4)
+
+        self.transient(parent)
+
+    def apply(self):
+        self.re = dict([(k, self.inputs[k].get().strip()) for k in self.inputs])
+        self.re['rating'] = None if self.rating.current() == 0 else int(self.rating.get())
+        self.re['hasRead'] = None if self.read.current() == 0 else self.read.get() == 'read'
+        self.destroy()
+
+    def show(self):
+        self.grab_set()
+        self.wait_window()
+        return self.re
+
+class StatsDialog(Toplevel):
+    # papers and read rates of every filter, stats: Library.libraryStats()
+    def __init__(self, parent, stats, total, read):
+        Toplevel.__init__(self, parent)
+        self.title("Statistics")
+
+        self.label = Label(self, text="{} papers, {} read ({:.0%}).".format(total, read, read / float(total) if total > 0 else 0))
+        self.stats_tree = ttk.Treeview(self, columns=('Papers', 'Read', 'Rate'), selectmode='browse')
+        self.stats_tree.heading('#0', text='Filter')
+        self.stats_tree.heading('Papers', text='Papers')
+        self.stats_tree.heading('Read', text='Read')
+        self.stats_tree.heading('Rate', text='Rate')
+        self.stats_tree.column('#0', width=400, stretch=1, anchor='w')
+        for col in ('Papers', 'Read', 'Rate'):
+            self.stats_tree.column(col, width=70, stretch=0, anchor='center')
+        self.st_yscroll = ttk.Scrollbar(self, command=self.stats_tree.yview, orient=VERTICAL)
+        self.stats_tree.configure(yscrollcommand=self.st_yscroll.set)
+
+        for filter_type in sorted(stats):
+            rows = stats[filter_type]
+            parent_id = self.stats_tree.insert('', 'end', text='{} ({})'.format(filter_type, len(rows)))
+            for filter_name, papers, read_papers in rows:
+                self.stats_tree.insert(parent_id, 'end', text=filter_name, values=(papers, read_papers, '{:.0%}'.format(read_papers / float(papers))))
+
+        self.close_button = ttk.Button(self, text="Close", command=self.destroy)
+
+        self.label.pack(side="top", fill="x")
+        self.close_button.pack(side="bottom", anchor="e", padx=4, pady=4)
+        self.stats_tree.pack(side="left", fill="both", expand=True)
+        self.st_yscroll.pack(side="left", fill="y")
+
+        self.transient(parent)
+
+class FederatedResultsDialog(Toplevel):
+    # papers found in several libraries, results: LibraryFederation.query(), double click to open the file
+    def __init__(self, parent, results, errors, open_paper):
+        Toplevel.__init__(self, parent)
+        self.title("Papers in All Libraries")
+        self.open_paper = open_paper
+        self.full_paths = {}
+
+        text = "{} papers in {} libraries.".format(len(results), len(set([r[0] for r in results])))
+        if len(errors) > 0:
+            text += "\nFailed to load: " + ', '.join(['{} ({})'.format(label, errors[label]) for label in sorted(errors)])
+        self.label = Label(self, text=text, justify=LEFT)
+        self.results_tree = ttk.Treeview(self, columns=('Library', 'Conf', 'Year'), selectmode='browse')
+        self.results_tree.heading('#0', text='Title')
+        self.results_tree.heading('Library', text='Library')
+        self.results_tree.heading('Conf', text='Conf')
+        self.results_tree.heading('Year', text='Year')
+        self.results_tree.column('#0', width=400, stretch=1, anchor='w')
+        self.results_tree.column('Library', width=100, stretch=0, anchor='w')
+        for col in ('Conf', 'Year'):
+            self.results_tree.column(col, width=70, stretch=0, anchor='center')
+        self.rt_yscroll = ttk.Scrollbar(self, command=self.results_tree.yview, orient=VERTICAL)
+        self.results_tree.configure(yscrollcommand=self.rt_yscroll.set)
+
+        for label, folder, paper in results:
+            tree_id = self.results_tree.insert('', 'end', text=paper.title, values=(label, paper.conference, paper.year))
+            self.full_paths[tree_id] = os.path.join(folder, paper.path)
+        self.results_tree.bind("<Double-1>", self.openPaperEvent)
+
+        self.close_button = ttk.Button(self, text="Close", command=self.destroy)
+
+        self.label.pack(side="top", fill="x")
+        self.close_button.pack(side="bottom", anchor="e", padx=4, pady=4)
+        self.results_tree.pack(side="left", fill="both", expand=True)
+        self.rt_yscroll.pack(side="left", fill="y")
+
+        self.transient(parent)
+
+    def openPaperEvent(self, event):
+        tree_id = self.results_tree.focus()
+        if tree_id in self.full_paths:
+            self.open_paper(self.full_paths[tree_id])
+
+class EntryCompleter:
+    # a popup list completing the last ';' separated item of an entry
+    # complete(prefix): [label, ...]
+    def __init__(self, entry, complete):
+        self.entry = entry
+        self.complete = complete
+        self.popup = None
+        self.listbox = None
+
+        self.entry.bind("<KeyRelease>", self.update, add='+')
+        self.entry.bind("<Down>", self.focusList, add='+')
+        self.entry.bind("<Escape>", self.hide, add='+')
+        self.entry.bind("<FocusOut>", self.hideLater, add='+')
+
+    def items(self):
+        return self.entry.get().split(';')
+
+    def update(self, event=None):
+        if event is not None and event.keysym in ('Down', 'Up', 'Return', 'Escape', 'Tab'):
+            return
+        items = self.items()
+        typed = set([item.strip().lower() for item in items[:-1]])
+        labels = [label for label in self.complete(items[-1]) if label not in typed]
+        if len(labels) < 1:
+            self.hide()
+            return
+        self.show(labels)
+
+    def show(self, labels):
+        if self.popup is None:
+            self.popup = Toplevel(self.entry)
+            self.popup.overrideredirect(True)
+            self.listbox = Listbox(self.popup, exportselection=False)
+            self.listbox.pack(fill='both', expand=True)
+            self.listbox.bind("<Return>", self.accept)
+            self.listbox.bind("<Double-1>", self.accept)
+            self.listbox.bind("<Escape>", self.hide)
+            self.listbox.bind("<FocusOut>", self.hideLater)
+        self.listbox.delete(0, END)
+        for label in labels:
+            self.listbox.insert(END, label)
+        self.listbox.config(height=len(labels))
+        self.popup.geometry("{}x{}+{}+{}".format(self.entry.winfo_width(), self.listbox.winfo_reqheight(),
+            self.entry.winfo_rootx(), self.entry.winfo_rooty() + self.entry.winfo_height()))
+        self.popup.deiconify()
+        self.popup.lift()
+
+    def focusList(self, event=None):
+        if self.popup is not None and self.popup.winfo_viewable():
+            self.listbox.focus_set()
+            self.listbox.selection_clear(0, END)
+            self.listbox.selection_set(0)
+            self.listbox.activate(0)
+            return "break"
+
+    def accept(self, event=None):
+        selection = self.listbox.curselection()
+        if len(selection) > 0:
+            items = self.items()
+            items[-1] = self.listbox.get(selection[0])
+            self.entry.delete(0, 'end')
+            self.entry.insert(0, ';'.join([item.strip() for item in items]) + ';')
+        self.hide()
+        self.entry.focus_set()
+        self.entry.icursor('end')
+        return "break"
+
+    def hide(self, event=None):
+        if self.popup is not None:
+            self.popup.withdraw()
+
+    # keep it while the focus moves between the entry and the list
+    def hideLater(self, event=None):
+        self.entry.after(100, self.hideUnlessFocused)
+
+    def hideUnlessFocused(self):
+        if self.entry.focus_get() not in (self.entry, self.listbox):
+            self.hide()
+
 FILTER_BOX = 0
 PAPER_TREE = 1
 class LibraryGUI:
 
-    def __init__(self):
+    # storage: LibraryStorage of the library, by default the one next to the program
+    def __init__(self, storage=None):
         self.lib = Library()
         self.cur_paper = Paper()
         # store the current selection idx of display_filter Listbox
+        # and the filter names of its entries, which are shown with counts
+        self.display_filter_names = []
         self.cur_filter_index = -1
         self.paper_to_tree = {}
+        self.papers_sort = None     # (column, reverse) the paper rows are sorted by, descending ids if None
         self.removed_files = []
 
+        self.storage = storage if storage is not None else openStorage()
+        self.saver = LibrarySaver(self.storage)
+        self.index_store = IndexStore(lib_index_file)
+        self.offline_index = OfflineIndex(offline_index_file)
+        self.autosave_id = None
+        self.reloading = False
+        self.save_pending = False   # a save waiting for the changes of another computer to be merged
+        self.prefetcher = FilePrefetcher() if PREFETCH_BUDGET > 0 else None
+        self.prefetched = []    # full paths of the last prefetch
+        self.federation = LibraryFederation()
+        for label, file_name in LibraryFederation.loadMounts(mounts_file):
+            self.federation.mount(label, file_name)
+
         self.display_columns = ('Title', 'Conf', 'Year', 'R', 'S')
         self.display_columns_values = lambda x: (x.title, x.conference, x.year, '1' if x.hasRead else '0', x.rating)
 
@@ -1102,8 +4018,14 @@ class LibraryGUI:
 
         self.progress = ttk.Progressbar(self.filter_frame, length=self.bar_length, orient=HORIZONTAL, mode='determinate')
 
+        # search as you type
+        self.search_input = ttk.Entry(self.display_frame)
+        self.search_input.bind("<KeyRelease>", self.searchKeyEvent)
+        self.search_id = None
+        self.search_state = None    # (normalized query, library generation, filter, paper ids) of the last search
+
         # display paper
-        self.display_papers = ttk.Treeview(self.display_frame)  # lists of existing papers
+        self.display_papers = ttk.Treeview(self.display_frame, selectmode='extended')  # lists of existing papers, edit or delete many at once
         self.dp_yscroll = ttk.Scrollbar(self.display_frame, command=self.display_papers.yview, orient=VERTICAL)
         self.display_papers.configure(yscrollcommand=self.dp_yscroll.set)
 
@@ -1142,6 +4064,10 @@ class LibraryGUI:
         self.labelDatasetInput = ttk.Label(self.info_frame, text='Datasets:')
         self.add_dataset_input = ttk.Entry(self.info_frame, width=4*self.cellWidth)
 
+        # complete the labels in use, e.g., to avoid near-duplicate tags
+        self.completers = [EntryCompleter(entry, lambda prefix, name=name: self.lib.completeLabel(name, prefix))
+            for entry, name in ((self.add_author_input, 'author'), (self.add_tag_input, 'tag'), (self.add_project_input, 'project'), (self.add_dataset_input, 'dataset'))]
+
         self.labelCommentInput = ttk.Label(self.info_frame, text='Notes:')
         self.add_comment_input = Text(self.info_frame, height=3, width=4*self.cellWidth)
         self.add_comment_input.bind("<Tab>", self.focus_next_widget)
@@ -1181,6 +4107,27 @@ class LibraryGUI:
         self.dproj_yscroll = ttk.Scrollbar(self.tags_frame, command=self.display_projects.yview, orient=VERTICAL)
         self.display_projects.configure(yscrollcommand=self.dproj_yscroll.set)
 
+        self.labelRelatedDisplay = ttk.Label(self.tags_frame, text='Related:')
+        self.display_related = Listbox(self.tags_frame, width=int(4*self.cellWidth))
+        self.drel_yscroll = ttk.Scrollbar(self.tags_frame, command=self.display_related.yview, orient=VERTICAL)
+        self.display_related.configure(yscrollcommand=self.drel_yscroll.set)
+        self.display_related.bind("<Double-1>", self.relatedPaperEvent)
+        self.related_ids = []      # paper ids of display_related
+
+        # background tasks status
+        self.status_frame = ttk.Frame(self.root)
+        self.status_var = StringVar()
+        self.status_var.set("Ready")
+        self.status_label = ttk.Label(self.status_frame, textvariable=self.status_var)
+        self.task_progress = ttk.Progressbar(self.status_frame, length=4*self.bar_length, orient=HORIZONTAL, mode='determinate')
+        self.cancel_task_button = ttk.Button(self.status_frame, command = self.cancelTasks, text = "Cancel", width=self.cellWidth)
+        self.tasks = TaskRunner(self.root, self.updateTaskStatus)
+
+        # tools menu
+        self.menubar = Menu(self.root)
+        self.tools_menu = Menu(self.menubar, tearoff=0)
+        self.menubar.add_cascade(label='Tools', menu=self.tools_menu)
+
     def focus_next_widget(self, event):
         event.widget.tk_focusNext().focus()
         return("break")
@@ -1191,6 +4138,8 @@ class LibraryGUI:
         self.initWindow()
         self.initButtons()
         self.initStyle()
+        if RELOAD_INTERVAL > 0:
+            self.root.after(RELOAD_INTERVAL, self.checkReload)
     
     def initStyle(self):
         # font
@@ -1238,6 +4187,18 @@ class LibraryGUI:
 
     def initWindow(self):
         self.root.protocol("WM_DELETE_WINDOW", self.closeWindow)
+        # tools
+        self.tools_menu.add_command(label='Statistics...', command=self.showStats)
+        self.tools_menu.add_command(label='Find Duplicates...', command=self.dedupePapers)
+        self.tools_menu.add_command(label='Merge Conflicted Copy...', command=self.mergeLibrary)
+        self.tools_menu.add_separator()
+        self.tools_menu.add_command(label='Mount Library...', command=self.mountLibrary)
+        self.tools_menu.add_command(label='Find in All Libraries', command=self.findFederated)
+        self.tools_menu.add_command(label='Filter in All Libraries', command=self.filterFederated)
+        self.tools_menu.add_separator()
+        self.tools_menu.add_command(label='Build Offline Index...', command=self.buildOfflineIndex)
+        self.tools_menu.add_command(label='Resolve needRevise Offline', command=self.resolveOffline)
+        self.root.config(menu=self.menubar)
         # filter
         self.filter_category['value'] = ['please select'] + self.filter_type_list
         self.filter_category['state'] = "readonly"
@@ -1283,6 +4244,9 @@ class LibraryGUI:
     def treeview_sort_column(self, tv, col, reverse):
         l = [(tv.set(k, col), k) for k in tv.get_children('')]
         l.sort(reverse=reverse)
+        if tv is self.display_papers:
+            # kept by the rows shown later on
+            self.papers_sort = (col, reverse)
 
         # rearrange items in sorted positions
         for index, (val, k) in enumerate(l):
@@ -1298,22 +4262,24 @@ class LibraryGUI:
         # self.add_button
         # self.reset_button
         self.del_button.config(state=DISABLED)     # .config(state=NORMAL)
+        self.cancel_task_button.config(state=DISABLED)
         # self.find_button
         self.revise_button.config(state=DISABLED) 
         self.serialize_button.config(state=DISABLED)
     
     def initConference(self, c_map_file):
         c_map = Conference.loadConference(c_map_file)
-        for c_str in c_map:
-            new_authorized_cstr = c_map[c_str]
-            c_name = self.lib.getConferenceName(new_authorized_cstr)
-            if c_name == OTHERS_CONFERENCE:
-                self.lib._conferences[new_authorized_cstr] = Conference(new_authorized_cstr)
-                self.lib._conference_alias[c_str] = new_authorized_cstr
-                self.lib._conference_alias[new_authorized_cstr] = new_authorized_cstr
-            else:
-                self.lib._conference_alias[c_str] = c_name
-                self.lib._conference_alias[new_authorized_cstr] = c_name
+        with self.lib.transaction():
+            for c_str in c_map:
+                new_authorized_cstr = c_map[c_str]
+                c_name = self.lib.getConferenceName(new_authorized_cstr)
+                if c_name == OTHERS_CONFERENCE:
+                    self.lib.addConference(new_authorized_cstr)
+                    self.lib.setConferenceAlias(c_str, new_authorized_cstr)
+                    self.lib.setConferenceAlias(new_authorized_cstr, new_authorized_cstr)
+                else:
+                    self.lib.setConferenceAlias(c_str, c_name)
+                    self.lib.setConferenceAlias(new_authorized_cstr, c_name)
         
         self.conference_list = list([k for k in self.lib.conferences if k != OTHERS_CONFERENCE])
         self.conference_list.sort()
@@ -1325,6 +4291,13 @@ class LibraryGUI:
     # finish gui arrange
     def gui_arrang(self):
         padding = 10
+        # packed first to span the whole width
+        self.status_frame.pack(side = BOTTOM, fill='x', expand=False, padx=(padding,padding), pady=(0,padding))
+        self.status_frame.columnconfigure(0, weight=1)
+        self.status_label.grid(row=0, column=0, sticky=W)
+        self.task_progress.grid(row=0, column=1, sticky=E, padx=(padding,padding))
+        self.cancel_task_button.grid(row=0, column=2, sticky=E)
+
         self.filter_frame.pack(side = LEFT, fill='both', expand=False, padx=(padding,0), pady=(padding,padding))
         # self.filter_frame.columnconfigure(0, weight=1)
         self.filter_frame.rowconfigure(2, weight=1)
@@ -1345,6 +4318,7 @@ class LibraryGUI:
         self.tags_frame.pack(side = RIGHT, fill='both', expand=False, padx=(0, padding), pady=(padding,padding))
         self.tags_frame.rowconfigure(1, weight=2)
         self.tags_frame.rowconfigure(4, weight=1)
+        self.tags_frame.rowconfigure(6, weight=2)
 
         # filter
         self.labelCategoryInput.grid(row=0, column=0, sticky=W)
@@ -1356,6 +4330,7 @@ class LibraryGUI:
 
         # display papers 19 columns, 13 rows
 
+        self.search_input.pack(side = TOP, fill='x', expand=False)
         self.display_papers.pack(side = LEFT, fill='both', expand=True)
         self.dp_yscroll.pack(side = LEFT, fill='both', expand=False)
 
@@ -1424,40 +4399,235 @@ class LibraryGUI:
         self.labelProjectDisplay.grid(row=3, column=0, sticky=W)
         self.display_projects.grid(row=4, column=0, sticky=(N,W,E,S))
         self.dproj_yscroll.grid(row=4, column=1, sticky=(N,W,S))
+
+        self.labelRelatedDisplay.grid(row=5, column=0, sticky=W)
+        self.display_related.grid(row=6, column=0, sticky=(N,W,E,S))
+        self.drel_yscroll.grid(row=6, column=1, sticky=(N,W,S))
     
     def serialize(self):
-        f = open(lib_file, 'wb')
-        pickle_dump(self.lib, f)
+        self.cancelAutosave()
+        self.saveLibrary()
         if len(self.removed_files)>0 and messagebox.askokcancel("Delete Local File!","Do you want to delete local files of removed papers?\n" + '\n'.join([os.path.relpath(f, application_path) for f in self.removed_files]) ) :
             for f in self.removed_files:
                 if os.path.isfile(f) :
                     os.remove(f)
+                    stat_cache.invalidate(f)
             self.removed_files.clear()
         
-        f = open(toread_file, 'w')
-        toread_ids = self.lib.tags['toread'].papers if 'toread' in self.lib.tags else set()
-        for pi in toread_ids:
-            f.write(self.lib.papers[pi].path+'\n')
-        f.close()
-
-        f = open(unread_file, 'w')
-        for pi in self.lib.findUnread():
-            f.write(self.lib.papers[pi].path+'\n')
-        f.close()
-
-        messagebox.showinfo(message='Save lib data success!')
+        self.writeReadingLists()
+
         self.unserializeMode()
+        self.afterSaved(self.showSaveResult)
         self.root.update()
+
+    def showSaveResult(self, error):
+        if error is None:
+            messagebox.showinfo(message='Save lib data success!')
+        else:
+            messagebox.showinfo(message='Save lib data failed!\n{}'.format(error))
+            self.serializeMode()
+
+    # call callback(error) on the gui thread once the saver is idle
+    def afterSaved(self, callback):
+        if self.saver.busy() or self.save_pending:
+            self.root.after(50, lambda: self.afterSaved(callback))
+        else:
+            callback(self.saver.error)
+
+    def writeReadingLists(self):
+        with open(toread_file, 'w') as f:
+            toread_ids = self.lib.tags['toread'].papers if 'toread' in self.lib.tags else set()
+            for pi in toread_ids:
+                f.write(self.lib.papers[pi].path+'\n')
+
+        with open(unread_file, 'w') as f:
+            for pi in self.lib.findUnread():
+                f.write(self.lib.papers[pi].path+'\n')
+
+    # debounce: a burst of edits is saved once, AUTOSAVE_DELAY after the last one
+    def scheduleAutosave(self):
+        if AUTOSAVE_DELAY <= 0: return
+        self.cancelAutosave()
+        self.autosave_id = self.root.after(AUTOSAVE_DELAY, self.autosave)
+
+    def cancelAutosave(self):
+        if self.autosave_id is not None:
+            self.root.after_cancel(self.autosave_id)
+            self.autosave_id = None
+
+    def autosave(self):
+        self.autosave_id = None
+        self.saveLibrary()
+        self.writeReadingLists()
+        # sync is still required to delete the local files of removed papers
+        if len(self.removed_files) == 0:
+            self.unserializeMode()
+        self.afterSaved(self.checkAutosaveResult)
+
+    def checkAutosaveResult(self, error):
+        # keep sync available to retry
+        if error is not None:
+            self.serializeMode()
     
+    # hot reload: apply the changes of the library saved by another computer, e.g., synchronized by the cloud storage
+    def checkReload(self):
+        self.root.after(RELOAD_INTERVAL, self.checkReload)
+        self.startReload()
+
+    def startReload(self):
+        if self.reloading or self.saver.busy() or not self.storage.changed(): return
+        self.reloading = True
+        local = self.reloadLocal()
+        generation = self.lib.generation
+        self.runTask("Reload", lambda task: self.loadReload(local), lambda result: self.reloadedLibrary(result, generation),
+                     on_error=self.reloadFailed, on_finish=self.finishReload)
+
+    # the library is what was loaded or saved last, except the papers edited since then, saved or not
+    def reloadLocal(self):
+        return self.lib.dirtyPapers() | self.saver.unsavedPapers()
+
+    # written once the changes of another computer are merged, so that they are never written over
+    def saveLibrary(self):
+        if self.reloading or self.storage.changed():
+            self.save_pending = True
+            self.startReload()
+            return
+        self.save_pending = False
+        self.saver.save(self.lib)
+
+    # runs on a worker, return (merge, storage signature it was loaded with)
+    def loadReload(self, local):
+        # only its records are merged, its indexes are never used
+        # still saved on top of the former one until the merge is applied
+        known_signature = self.storage.known_signature
+        try:
+            with deferredIndexes():
+                other = self.storage.load()
+        finally:
+            signature, self.storage.known_signature = self.storage.known_signature, known_signature
+        if other is None: return None, signature
+        return LibraryMerge(self.lib, other, self.lib, local), signature
+
+    # e.g., a file being synchronized, tried again once it changes
+    def reloadFailed(self, error):
+        pass
+
+    def finishReload(self):
+        self.reloading = False
+        if self.save_pending and not self.storage.changed():
+            self.saveLibrary()
+
+    # apply a reload to the library unless edited meanwhile, return the ids of the added papers, None if edited
+    def applyReload(self, result, generation):
+        merge, signature = result
+        added = []
+        refused = self.saver.unsaved is not None
+        if merge is not None and merge.changed():
+            if self.lib.generation != generation:
+                # edited meanwhile, merged again by the next check
+                return None
+            with self.lib.transaction():
+                local = self.lib.takeDirtyPapers() | self.saver.unsavedPapers()
+                # by paper too, one added meanwhile may get another id
+                local_papers = [self.lib.papers[pi] for pi in local if pi in self.lib.papers]
+                added = merge.apply(self.lib)
+                # the reloaded papers are saved already, unlike the local edits, those of a refused write snapshotted again
+                self.lib.takeDirtyPapers()
+                self.saver.dropUnsaved()
+                for pi in local | set([paper.id for paper in local_papers]):
+                    self.lib.touchPaper(pi)
+        # saved on top of it from now on, the refused write again
+        self.storage.known_signature = signature
+        self.save_pending = self.save_pending or refused
+        return added
+
+    def reloadedLibrary(self, result, generation):
+        merge = result[0]
+        added = self.applyReload(result, generation)
+        if added is None or merge is None or not merge.changed(): return
+
+        # only the affected rows and filter entries
+        if self.cur_paper.id in merge.removed:
+            self.addMode()
+        elif self.cur_paper.id in merge.updated:
+            self.cur_paper = self.lib.papers[self.cur_paper.id]
+            self.selectMode()
+        view = self.viewPapers()
+        shown = set(self.paper_to_tree) - merge.removed
+        shown.update([pi for pi in added if pi in view])
+        self.showPapers(shown)
+        # the ids of ours given new ones are theirs now
+        self.refreshPapers([pi for pi in set(merge.updated) | merge.movable if pi in self.paper_to_tree])
+        self.refreshDisplayFilter()
+
+    # the papers of the selected filter narrowed by the search, all papers otherwise
+    def viewPapers(self):
+        papers = self.filteredPapers()
+        query = normalizeTitle(self.search_input.get())
+        if len(query) > 0:
+            return self.lib.searchTokens(query, papers)
+        return papers if papers is not None else self.lib.papers
+
+    # the papers of the selected filter, None without one
+    def filteredPapers(self):
+        key = self.selectedFilter()
+        return self.filterPapers(*key) if key is not None else None
+
+    # (filter type, filter name) selected, None without one
+    def selectedFilter(self):
+        if self.cur_filter_index >= 0 and self.cur_filter_index < len(self.display_filter_names):
+            return (self.filter_category.get(), self.display_filter_names[self.cur_filter_index])
+        return None
+
     def deserialize(self):
-        if os.path.isfile(lib_file):
-            f = open(lib_file, 'rb')
-            self.lib = pickle_load(f)
+        with deferredIndexes():
+            lib = self.storage.load()
+        if lib is not None:
+            self.lib = lib
+            signature = self.storage.known_signature
+            state = self.index_store.load(signature, lib)
+            if state is not None:
+                lib.loadIndexes(state)
+            else:
+                # missing or stale, searched, counted and related once rebuilt
+                self.runTask("Index", lambda task: self.rebuildIndexes(lib, signature), self.rebuiltIndexes)
+            # e.g., converted from the former pickle, written at once as a whole
+            if self.storage.full and len(self.lib.papers) > 0:
+                self.saver.save(self.lib)
+
+    # runs on a worker
+    def rebuildIndexes(self, lib, signature):
+        state = lib.rebuildIndexes()
+        with lib.reading():
+            # unless edited or reloaded meanwhile, the indexes are of the library as saved
+            if len(lib.dirtyPapers()) == 0 and self.storage.known_signature == signature:
+                try:
+                    self.index_store.save(signature, lib, state)
+                except (IOError, OSError):
+                    # built again by the next start
+                    pass
+        return lib
+
+    def rebuiltIndexes(self, lib):
+        if lib is not self.lib: return
+        self.refreshDisplayFilter()
+        self.displayRelated(self.cur_paper.id)
+
+    # keep the indexes of the library as saved for the next start
+    def saveIndexes(self):
+        if not self.lib.indexed or self.reloading or self.saver.unsaved is not None: return
+        if len(self.lib.dirtyPapers()) > 0 or self.storage.signature() != self.storage.known_signature: return
+        try:
+            self.index_store.save(self.storage.known_signature, self.lib)
+        except (IOError, OSError):
+            # built again by the next start
+            pass
 
     # main modes
     
     def selectMode(self):
         self.displayData(self.cur_paper)
+        self.displayRelated(self.cur_paper.id)
 
         self.add_button.config(state=DISABLED)
         self.find_button.config(state=DISABLED)
@@ -1467,6 +4637,7 @@ class LibraryGUI:
     def addMode(self):
         # reset cur paper
         self.cur_paper = Paper()
+        self.displayRelated(self.cur_paper.id)
 
         self.clearBibData()
         self.clearOtherData()
@@ -1483,14 +4654,15 @@ class LibraryGUI:
         
         self.setFilterCategory(fc_idx)
         
-        displayed_filternames = self.display_filter.get(0, "end")
-        if df_idx >= 0 and df_idx < len(displayed_filternames):
+        if df_idx >= 0 and df_idx < len(self.display_filter_names):
             self.setDisplayFilter(df_idx)
 
         self.serializeMode()
     
     def resetMode(self):
         self.cur_paper = Paper()
+        self.displayRelated(self.cur_paper.id)
+        self.clearSearch()
 
         self.clearBibData()
         self.clearOtherData()
@@ -1509,6 +4681,7 @@ class LibraryGUI:
     
     def serializeMode(self):
         self.serialize_button.config(state=NORMAL)
+        self.scheduleAutosave()
     
     def unserializeMode(self):
         self.serialize_button.config(state=DISABLED)
@@ -1548,6 +4721,11 @@ class LibraryGUI:
             self.root.update()
 
     def delPaper(self):
+        paper_ids = self.selectedPaperIds()
+        if len(paper_ids) > 1:
+            self.delPapers(paper_ids)
+            return
+
         paper_id = self.cur_paper.id
 
         self.removed_files.append(self.cur_paper.full_path)
@@ -1558,7 +4736,19 @@ class LibraryGUI:
         del self.paper_to_tree[paper_id]
 
         self.updateMode()
+        self.selectFirstPaper()
+
+    def delPapers(self, paper_ids):
+        if not messagebox.askokcancel("Delete Papers", "Do you want to delete the {} selected papers?".format(len(paper_ids))):
+            return
+        self.removed_files.extend([self.lib.papers[pi].full_path for pi in paper_ids])
+        self.lib.removePapers(paper_ids)
+        self.display_papers.delete(*[self.paper_to_tree.pop(pi) for pi in paper_ids if pi in self.paper_to_tree])
+
+        self.updateMode()
+        self.selectFirstPaper()
 
+    def selectFirstPaper(self):
         cur_trees = self.display_papers.get_children()
         if len(cur_trees) > 0:
             next_paper_treeid = cur_trees[0]
@@ -1568,6 +4758,88 @@ class LibraryGUI:
         else:
             self.resetMode()
     
+    def showStats(self):
+        total, read = self.lib.filterStats('all', '')
+        StatsDialog(self.root, self.lib.libraryStats(), total, read)
+
+    def dedupePapers(self):
+        pairs = self.lib.findNearDuplicatePapers()
+        if len(pairs) < 1:
+            messagebox.showinfo(message='Find no near-duplicate papers!')
+            self.root.update()
+            return
+        DuplicateDialog(self.root, self.lib, pairs, self.mergePaper).show()
+
+    def mergePaper(self, keep_id, drop_id):
+        drop_path = self.lib.papers[drop_id].full_path
+        if drop_path != self.lib.papers[keep_id].full_path:
+            self.removed_files.append(drop_path)
+        self.lib.mergePapers(keep_id, drop_id)
+
+        if drop_id in self.paper_to_tree:
+            self.display_papers.delete(self.paper_to_tree[drop_id])
+            del self.paper_to_tree[drop_id]
+        if keep_id in self.paper_to_tree:
+            values = self.display_columns_values(self.lib.papers[keep_id])
+            for i, col in enumerate(self.display_columns):
+                self.display_papers.set(self.paper_to_tree[keep_id], column=col, value=values[i])
+        self.updateMode()
+
+    # search as you type
+
+    def searchKeyEvent(self, event):
+        if self.search_id is not None:
+            self.root.after_cancel(self.search_id)
+        self.search_id = self.root.after(SEARCH_DELAY, self.searchPapers)
+
+    # within the selected filter, if any
+    def searchPapers(self):
+        self.search_id = None
+        query = normalizeTitle(self.search_input.get())
+        key = self.selectedFilter()
+        if len(query) < 1:
+            self.search_state = None
+            self.showPapers(self.viewPapers())
+            return
+
+        # a longer query only narrows the former result, unless the library or the filter is changed meanwhile
+        candidates = self.filterPapers(*key) if key is not None else None
+        if self.search_state is not None:
+            last_query, generation, last_key, paper_ids = self.search_state
+            if generation == self.lib.generation and last_key == key and query.startswith(last_query):
+                candidates = paper_ids
+        paper_ids = self.lib.searchTokens(query, candidates)
+        self.search_state = (query, self.lib.generation, key, paper_ids)
+        self.showPapers(paper_ids)
+
+    def clearSearch(self):
+        if self.search_id is not None:
+            self.root.after_cancel(self.search_id)
+            self.search_id = None
+        self.search_input.delete(0, 'end')
+        self.search_state = None
+
+    # only remove and insert the changed rows, keeping the order of the sorted column
+    def showPapers(self, paper_ids):
+        paper_ids = set(paper_ids)
+        removed = [pi for pi in self.paper_to_tree if pi not in paper_ids]
+        if len(removed) > 0:
+            self.display_papers.delete(*[self.paper_to_tree.pop(pi) for pi in removed])
+
+        if len(paper_ids) == len(self.paper_to_tree): return
+        # inserted by the final position, the rows before it are there already
+        for index, pi in enumerate(self.sortedPapers(paper_ids)):
+            if pi not in self.paper_to_tree:
+                self.paper_to_tree[pi] = self.display_papers.insert('', index, text=pi, values=self.display_columns_values(self.lib.papers[pi]))
+
+    # paper ids in the order of the rows: by the sorted column as its text, like treeview_sort_column, descending ids otherwise
+    def sortedPapers(self, paper_ids):
+        if self.papers_sort is None:
+            return sorted(paper_ids, reverse=True)
+        col, reverse = self.papers_sort
+        index = self.display_columns.index(col)
+        return sorted(paper_ids, key=lambda pi: str(self.display_columns_values(self.lib.papers[pi])[index]), reverse=reverse)
+
     # todo: first search on path, then other information
     def findPaper(self):
         self.cur_paper = Paper()
@@ -1584,6 +4856,10 @@ class LibraryGUI:
         self.displayPaper(paper_ids)
     
     def revisePaper(self):
+        paper_ids = self.selectedPaperIds()
+        if len(paper_ids) > 1:
+            self.revisePapers(paper_ids)
+            return
         
         target_paper_id = self.cur_paper.id
 
@@ -1634,6 +4910,30 @@ class LibraryGUI:
             self.cur_paper = self.lib.papers[target_paper_id]
             self.display_papers.selection_set(tree_id)
     
+    def revisePapers(self, paper_ids):
+        edit = BatchEditDialog(self.root, len(paper_ids)).show()
+        if edit is None: return
+
+        add = {'tag': self.lib.parseTags(edit['add_tag']), 'project': self.lib.parseProjects(edit['add_project']), 'dataset': self.lib.parseDatasets(edit['add_dataset'])}
+        remove = {'tag': set(Tag.parse(edit['remove_tag'].lower())), 'project': set(Project.parse(edit['remove_project'].lower())), 'dataset': set(Dataset.parse(edit['remove_dataset'].lower()))}
+        revised = self.lib.editPapers(paper_ids, add, remove, edit['rating'], edit['hasRead'])
+        if len(revised) < 1: return
+
+        self.refreshPapers(revised)
+        self.updateMode()
+        if self.cur_paper.id in revised:
+            self.displayData(self.cur_paper)
+
+    # the selected paper ids in the paper list
+    def selectedPaperIds(self):
+        return [self.display_papers.item(tree_id)['text'] for tree_id in self.display_papers.selection()]
+
+    # update the displayed rows of the revised papers
+    def refreshPapers(self, paper_ids):
+        for pi in paper_ids:
+            if pi in self.paper_to_tree:
+                self.display_papers.item(self.paper_to_tree[pi], values=self.display_columns_values(self.lib.papers[pi]))
+
     def parseBib(self):
         bib_str = self.add_bib_input.get(1.0, END).strip()
         if len(bib_str) > 0:
@@ -1642,87 +4942,176 @@ class LibraryGUI:
 
     def reparse(self):
         if messagebox.askokcancel("ReNewal","Do you want to re-Parse bibtex and path for all papers?") :
-            # collect all papers' paths
-            lib_files = {}
-            existing_files = {}     # all files in the current folder
-
-            same_files = {}     # different files share common filename
+            self.scanReparseFiles(self.lib.file_hashes.snapshot())
+        self.root.update()
 
-            new_files = set()
-            to_be_corrected_files = set()
+    # scan and hash the files in background, then reparse
+    def scanReparseFiles(self, hash_entries):
+        lib_full_paths = set([self.lib.papers[pi].full_path for pi in self.lib.papers])
+        bibtexes = dict([(pi, self.lib.papers[pi].bibtex) for pi in self.lib.papers if len(self.lib.papers[pi].bibtex) > 0])
+        self.runTask("Renew", lambda task: self.scanLibraryFiles(lib_full_paths, bibtexes, task), lambda scanned: self.reparseFiles(hash_entries, scanned), button=self.reparse_button)
+
+    # runs on a worker
+    # the bibtex fields are extracted here, only resolving them against the library is left to reparseFiles
+    def scanLibraryFiles(self, lib_full_paths, bibtexes, task=None):
+        existing_files, same_files = self.scanFiles(task)
+        # identical files under different names or folders
+        copy_files = self.findCopyFiles(list(existing_files.values()) + list(same_files.keys()), lib_full_paths, task)
+        paper_ids = list(bibtexes.keys())
+        bib_strs = [bibtexes[pi] for pi in paper_ids]
+        extracted = dict(zip(paper_ids, zip(bib_strs, extractBibFieldsAll(bib_strs, task))))
+        return existing_files, same_files, copy_files, extracted
+
+    def reparseFiles(self, hash_entries, scanned):
+        existing_files, same_files, copy_files, extracted = scanned
+
+        if len(copy_files) > 0 and messagebox.askokcancel("Identical files!", "Do you want to delete the following copies of identical files?\n\n"+"\n".join(["{}->{}".format(k, copy_files[k]) for k in copy_files])):
+            for f in copy_files:
+                os.remove(f)
+                stat_cache.invalidate(f)
+            self.scanReparseFiles(hash_entries)
+            return
 
-            for paper_id in self.lib.papers:
-                paper = self.lib.papers[paper_id]
-                lib_files[ntpath.basename(paper.path)] = paper_id
-            
-            for (dirpath, dirs, filenames) in os.walk(application_path):
-                # skip hidden folders and files
-                files = [f for f in filenames if not f[0] == '.' and f.endswith(filetypes)]
-                dirs[:] = [d for d in dirs if not d[0] == '.']
-
-                for filename in files:
-                    tmp_full_path = os.path.join(dirpath, filename)
-                    if filename not in existing_files:
-                        existing_files[filename] = tmp_full_path
-
-                        if filename not in lib_files :
-                            new_files.add(filename)
-                        elif tmp_full_path != self.lib.papers[lib_files[filename]].full_path :
-                            to_be_corrected_files.add(filename)
-                    else:
-                        same_files[tmp_full_path] = filename
-            
-            nofile_lib_pis = set()
-            for f in lib_files:
-                if f not in existing_files:
-                    nofile_lib_pis.add(lib_files[f])
-                    self.lib.papers[lib_files[f]]._need_revise = True
-            
-            if len(same_files) > 0:
-                # todo: custom dialog
-                if messagebox.askokcancel("Reparse failed!","Do you want to delete the following repeated files or do it by yourself?\n\n"+"\n".join(["{}->{}".format(k, existing_files[same_files[k]]) for k in same_files])):
-                    for f in same_files:
-                        os.remove(f)
-            else:
-                revise_bib_count = 0
+        # collect all papers' paths
+        lib_files = {}
+        for paper_id in self.lib.papers:
+            paper = self.lib.papers[paper_id]
+            lib_files[ntpath.basename(paper.path)] = paper_id
+
+        new_files = set()
+        to_be_corrected_files = set()
+        for filename in existing_files:
+            if filename not in lib_files:
+                if existing_files[filename] not in copy_files:
+                    new_files.add(filename)
+            elif existing_files[filename] != self.lib.papers[lib_files[filename]].full_path :
+                to_be_corrected_files.add(filename)
+
+        # follow renamed or moved files by their content
+        new_digests = {}
+        for filename in new_files:
+            new_digests[self.lib.file_hashes.lookup(os.path.relpath(existing_files[filename], start=application_path))] = filename
+        moved_files = {}     # paper_id: full path
+        
+        nofile_lib_pis = set()
+        for f in lib_files:
+            if f not in existing_files:
+                digest = self.lib.file_hashes.lookup(self.lib.papers[lib_files[f]].path)
+                if digest is not None and digest in new_digests:
+                    moved_files[lib_files[f]] = existing_files[new_digests[digest]]
+                    new_files.discard(new_digests[digest])
+                    continue
+                nofile_lib_pis.add(lib_files[f])
+                self.lib.papers[lib_files[f]]._need_revise = True
+                self.lib.touchPaper(lib_files[f])
+        
+        if len(same_files) > 0:
+            # todo: custom dialog
+            if messagebox.askokcancel("Reparse failed!","Do you want to delete the following repeated files or do it by yourself?\n\n"+"\n".join(["{}->{}".format(k, existing_files[same_files[k]]) for k in same_files])):
+                for f in same_files:
+                    os.remove(f)
+                    stat_cache.invalidate(f)
+        else:
+            revise_bib_count = 0
+            with self.lib.transaction():
                 for paper_id in self.lib.papers:
                     paper = self.lib.papers[paper_id]
                     # reparse bibtex
                     if len(paper.bib.bibtex) > 0 :
-                        b = bibParser.parse(paper.bib.bibtex, self.lib)
+                        bib_str, fields = extracted.get(paper_id, (None, None))
+                        # edited while scanning
+                        if bib_str != paper.bib.bibtex:
+                            fields = bibParser.extractFields(paper.bib.bibtex)
+                        b = bibParser.buildBib(paper.bib.bibtex, fields, self.lib)
                         if self.lib.revisePaperBib(paper_id, b) : revise_bib_count += 1
                         if paper.checkState() > 0:
                             nofile_lib_pis.add(paper_id)
                             paper._need_revise = True
+                            self.lib.touchPaper(paper_id)
 
                 # correct path
-                for f in to_be_corrected_files:
-                    self.lib.papers[lib_files[f]].path = os.path.relpath(existing_files[f], start=application_path)
-                        
-                self.resetMode()
-
-                if len(nofile_lib_pis) + len(new_files)>0 and messagebox.askokcancel("Incorrect and New Files!", "Reparse success! {} bibtex and {} path!\n".format(revise_bib_count, len(to_be_corrected_files)) + 
-                "Added {} new files!".format(len(new_files)) + 
-                "Do you want to correct {} path and complete new files now?\n".format(len(nofile_lib_pis)) ):
+                with deferredPathValidation():
+                    for f in to_be_corrected_files:
+                        self.lib.papers[lib_files[f]].path = os.path.relpath(existing_files[f], start=application_path)
+                        self.lib.touchPaper(lib_files[f])
+                    for paper_id in moved_files:
+                        self.lib.papers[paper_id].path = os.path.relpath(moved_files[paper_id], start=application_path)
+                        self.lib.touchPaper(paper_id)
+            corrected_count = len(to_be_corrected_files) + len(moved_files)
+                    
+            self.resetMode()
 
-                    # add new files
-                    new_paths = [existing_files[filename] for filename in new_files]
-                    self.importNewPapers(new_paths)
+            if len(nofile_lib_pis) + len(new_files)>0 and messagebox.askokcancel("Incorrect and New Files!", "Reparse success! {} bibtex and {} path!\n".format(revise_bib_count, corrected_count) + 
+            "Added {} new files!".format(len(new_files)) + 
+            "Do you want to correct {} path and complete new files now?\n".format(len(nofile_lib_pis)) ):
 
-                    self.setFilter('others', 'needRevise')
+                # add new files
+                new_paths = [existing_files[filename] for filename in new_files]
+                self.importNewPapers(new_paths, lambda new_paper_ids: self.showNeedRevise())
+            else:
+                messagebox.showinfo(message="Reparse success! {} bibtex and {} path!\n".format(revise_bib_count, corrected_count))
+                if revise_bib_count > 0 or corrected_count > 0:
                     self.serializeMode()
-                else:
-                    messagebox.showinfo(message="Reparse success! {} bibtex and {} path!\n".format(revise_bib_count, len(to_be_corrected_files)))
-                    if revise_bib_count > 0 or len(to_be_corrected_files)>0:
-                        self.serializeMode()
+
+        # forget the hashes of files neither existing nor in the library
+        keep_paths = set([self.lib.papers[pi].path for pi in self.lib.papers])
+        keep_paths.update([os.path.relpath(f, start=application_path) for f in list(existing_files.values()) + list(same_files.keys())])
+        self.lib.file_hashes.prune(keep_paths)
+        if self.lib.file_hashes.snapshot() != hash_entries:
+            self.serializeMode()
         self.root.update()
+
+    def showNeedRevise(self):
+        self.setFilter('others', 'needRevise')
+        self.serializeMode()
+
+    # return {filename: full path, ...} of the first file of each filename, and {full path: filename, ...} of the other files sharing a filename
+    def scanFiles(self, task=None):
+        existing_files = {}     # all files in the current folder
+        same_files = {}     # different files share common filename
+        for (dirpath, dirs, filenames) in os.walk(application_path):
+            if task is not None:
+                task.checkCancelled()
+                task.setProgress(0, 0, 'scanning ' + os.path.relpath(dirpath, application_path))
+            # the later path checks of these files need no stat
+            stat_cache.addListing(dirpath, filenames, dirs)
+            # skip hidden folders and files
+            files = [f for f in filenames if not f[0] == '.' and f.endswith(filetypes)]
+            dirs[:] = [d for d in dirs if not d[0] == '.']
+
+            for filename in files:
+                tmp_full_path = os.path.join(dirpath, filename)
+                if filename not in existing_files:
+                    existing_files[filename] = tmp_full_path
+                else:
+                    same_files[tmp_full_path] = filename
+        return existing_files, same_files
+
+    # files with identical content, return {copy full path: kept full path, ...}
+    # the kept file of a group is the one in library if any
+    def findCopyFiles(self, full_paths, lib_full_paths, task=None):
+        rel_paths = [os.path.relpath(f, start=application_path) for f in full_paths]
+        digests = self.lib.file_hashes.digestFiles(rel_paths, task=task)
+        groups = {}
+        for full_path, rel_path in zip(full_paths, rel_paths):
+            if rel_path in digests:
+                groups.setdefault(digests[rel_path], []).append(full_path)
+
+        copy_files = {}
+        for digest in groups:
+            group = groups[digest]
+            if len(group) < 2: continue
+            group.sort(key=lambda f: (f not in lib_full_paths, f))
+            for f in group[1:]:
+                if f not in lib_full_paths:
+                    copy_files[f] = group[0]
+        return copy_files
     
     def setFilter(self, filter_category, filtername):
         self.setFilterCategoryByName(filter_category)
 
-        displayed_filternames = self.display_filter.get(0, "end")
-        if filtername in displayed_filternames:
-            filter_idx = displayed_filternames.index(filtername)
+        if filtername in self.display_filter_names:
+            filter_idx = self.display_filter_names.index(filtername)
             self.setDisplayFilter(filter_idx)
 
     def setFilterCategory(self, idx):
@@ -1734,19 +5123,48 @@ class LibraryGUI:
                 self.filter_category.current(idx)
             else: idx = self.filter_category.current()
             filtertype = self.filter_type_list[idx-1]
-            filters = self.filter_dict[filtertype][0]
-            
-            tmp_f_list = [f for f in filters if f != 'others']
-            tmp_f_list.sort()
-            if 'others' in filters:
-                tmp_f_list.append('others')
-
-            if len(tmp_f_list) > 0:
-                for f in tmp_f_list:
-                    self.display_filter.insert(END, f)
+            entries = self.filterEntries(filtertype)
+            if len(entries) > 0:
+                for f, text in entries:
+                    self.display_filter_names.append(f)
+                    self.display_filter.insert(END, text)
                 self.setDisplayFilter(0)
         else:
             self.resetMode()
+
+    # [(filter name, text shown), ...] of a filter type
+    def filterEntries(self, filtertype):
+        filters = self.filter_dict[filtertype][0]
+        tmp_f_list = [f for f in filters if f != 'others']
+        tmp_f_list.sort()
+        if 'others' in filters:
+            tmp_f_list.append('others')
+        return [(f, f if filtertype == 'others' and f == 'needRevise' else "{} ({})".format(f, self.lib.filterStats(filtertype, f)[0])) for f in tmp_f_list]
+
+    # update the changed entries of the filter list in place, keeping the selected filter and the displayed papers
+    def refreshDisplayFilter(self):
+        idx = self.filter_category.current()
+        if idx <= 0: return
+        entries = self.filterEntries(self.filter_type_list[idx-1])
+        selected = self.display_filter_names[self.cur_filter_index] if 0 <= self.cur_filter_index < len(self.display_filter_names) else None
+
+        names = set([f for f, text in entries])
+        for i in reversed(range(len(self.display_filter_names))):
+            if self.display_filter_names[i] not in names:
+                self.display_filter.delete(i)
+                del self.display_filter_names[i]
+        for i, (f, text) in enumerate(entries):
+            if i >= len(self.display_filter_names) or self.display_filter_names[i] != f:
+                self.display_filter.insert(i, text)
+                self.display_filter_names.insert(i, f)
+            elif self.display_filter.get(i) != text:
+                self.display_filter.delete(i)
+                self.display_filter.insert(i, text)
+
+        self.cur_filter_index = self.display_filter_names.index(selected) if selected in names else -1
+        self.display_filter.selection_clear(0, END)
+        if self.cur_filter_index >= 0:
+            self.display_filter.selection_set(self.cur_filter_index)
     
     def setFilterCategoryByName(self, filter_category):
         if filter_category in self.filter_type_list:
@@ -1755,20 +5173,71 @@ class LibraryGUI:
         self.setFilterCategory(idx)
         return idx
     
-    def importNewPapers(self, new_files):
+    # read the metadata in background, then add the papers and call on_done(new_paper_ids)
+    def importNewPapers(self, new_files, on_done=None):
+        def added(result):
+            new_paper_ids = self.addImportedPapers(new_files, *result)
+            if on_done is not None: on_done(new_paper_ids)
+        self.runTask("Import", lambda task: self.readImportMetadata(new_files, task), added, button=self.import_button)
+
+    # runs on a worker
+    def readImportMetadata(self, new_files, task=None):
+        metas = readPdfMetadataAll(new_files, task=task)
+        # the offline index, if any, completes the bib of the dois and embedded titles
+        found, found_dois = {}, {}
+        dois = set([metas[p]['doi'].lower() for p in metas if 'doi' in metas[p]])
+        if self.offline_index.exists():
+            found = self.offline_index.lookup([metas[p]['title'] for p in metas if 'title' in metas[p]])
+            found_dois = self.offline_index.lookupDois(dois)
+        # the other dois by doi.org
+        for i, doi in enumerate(sorted(dois - set(found_dois))):
+            if task is not None:
+                task.checkCancelled()
+                task.setProgress(i, len(dois), 'resolving doi ' + doi)
+            try:
+                found_dois[doi] = bibParser.queryDoi(doi)
+            except (IOError, OSError, ValueError):
+                # e.g., offline, left to the title
+                pass
+        return metas, found, found_dois
+
+    def addImportedPapers(self, new_files, metas, found, found_dois):
         new_paper_ids = set()
-        for path in new_files:
-            tmp_paper = Paper()
-            tmp_paper.path = os.path.relpath(path, start=application_path)
-            tmp_paper.title = self.extractTitleFromPath(tmp_paper.path)
-            tmp_paper._need_revise = True
-            # todo: what if there is duplicated papers
-            depulated_pi = self.lib.searchDuplicatePaper(tmp_paper)
-            if depulated_pi < 0:
-                new_paper_ids.add(self.lib.addPaper(tmp_paper))
+        with self.lib.transaction(), deferredPathValidation():
+            for path in new_files:
+                tmp_paper = Paper()
+                tmp_paper.path = os.path.relpath(path, start=application_path)
+                tmp_paper.title = self.extractTitleFromPath(tmp_paper.path)
+                self.fillPaperMetadata(tmp_paper, metas.get(path, {}), found, found_dois)
+                tmp_paper._need_revise = tmp_paper.checkState() > 0
+                # todo: what if there is duplicated papers
+                depulated_pi = self.lib.searchDuplicatePaper(tmp_paper)
+                if depulated_pi < 0:
+                    new_paper_ids.add(self.lib.addPaper(tmp_paper))
         return new_paper_ids
 
     
+    def fillPaperMetadata(self, paper, meta, found, found_dois):
+        # the doi identifies the paper, rather than its embedded title
+        bibtex = found_dois.get(meta['doi'].lower()) if 'doi' in meta else None
+        if bibtex and len(bibParser.titleParser(bibtex)) > 0:
+            paper.bib = bibParser.parse(bibtex, self.lib)
+            return
+        if 'title' in meta and normalizeTitle(meta['title']) in found:
+            paper.bib = bibParser.parse(found[normalizeTitle(meta['title'])], self.lib)
+            return
+        if 'title' in meta:
+            paper.title = meta['title']
+        if 'author' in meta:
+            paper.author = self.lib.parseAuthors(';'.join(meta['author']))
+        if 'year' in meta:
+            paper.year = meta['year']
+        if 'arxiv' in meta:
+            paper.conference = self.lib.parseConference('arxiv preprint arxiv:' + meta['arxiv'])
+            paper.papertype = 1
+        if paper.checkState() == 0:
+            paper.bibtex = paper.bib.__repr__()
+
     def importFiles(self):
         # Ask the user to select multiple files
         path_list = filedialog.askopenfilenames(parent=self.root,
@@ -1776,10 +5245,11 @@ class LibraryGUI:
                                     title="Please select files:",
                                     filetypes=my_filetypes)
         if len(path_list) > 0:
-            new_paper_ids = self.importNewPapers(path_list)
-            if len(new_paper_ids) > 0:
-                self.setFilter('others', 'needRevise')
-                self.serializeMode()
+            self.importNewPapers(path_list, self.importedPapers)
+
+    def importedPapers(self, new_paper_ids):
+        if len(new_paper_ids) > 0:
+            self.showNeedRevise()
     
     def browseFiles(self):
         # Ask the user to select a single file name.
@@ -1808,27 +5278,157 @@ class LibraryGUI:
                 title = filename[:-len(ft)]
         return title
 
+    def buildOfflineIndex(self):
+        dump_file = filedialog.askopenfilename(parent=self.root,
+                                    initialdir=application_path,
+                                    title="Please select a dblp xml or arxiv metadata jsonl dump:",
+                                    filetypes=[('all files', '.*'), ('dblp xml', '.xml'), ('dblp xml', '.gz'), ('arxiv jsonl', '.json'), ('arxiv jsonl', '.jsonl')])
+        if len(dump_file) > 0:
+            self.runTask("Offline index", lambda task: self.offline_index.build(dump_file, task), self.builtOfflineIndex)
+
+    # merge a conflicted copy of the library made by the cloud sync into the current one
+    def mergeLibrary(self):
+        file_name = filedialog.askopenfilename(parent=self.root,
+                                    initialdir=application_path,
+                                    title="Please select a copy of the library (.dat, .db, or meta.json of shards):",
+                                    filetypes=[('all files', '.*'), ('pickle', '.dat'), ('sqlite', '.db'), ('shards', '.json')])
+        if len(file_name) > 0:
+            self.runTask("Merge", lambda task: self.loadMerge(file_name), self.mergedLibrary)
+
+    # runs on a worker
+    def loadMerge(self, file_name):
+        with deferredIndexes():
+            other = storageOf(file_name).load()
+        if other is None:
+            raise IOError("no library in " + file_name)
+        return LibraryMerge(self.lib, other)
+
+    def mergedLibrary(self, merge):
+        if not merge.changed():
+            messagebox.showinfo(message="Nothing to merge!\n" + merge.summary(MERGE_SHOWN_CONFLICTS))
+        elif messagebox.askokcancel("Merge", "Do you want to merge the copy?\n\n" + merge.summary(MERGE_SHOWN_CONFLICTS)):
+            merge.apply(self.lib)
+            self.resetMode()
+            self.updateMode()
+            self.serializeMode()
+        self.root.update()
+
+    # mount the library of another folder, kept in the mounts file
+    def mountLibrary(self):
+        file_name = filedialog.askopenfilename(parent=self.root,
+                                    initialdir=application_path,
+                                    title="Please select a library to mount (.dat, .db, or meta.json of shards):",
+                                    filetypes=[('all files', '.*'), ('pickle', '.dat'), ('sqlite', '.db'), ('shards', '.json')])
+        if len(file_name) < 1: return
+        label = LibraryFederation.labelOf(file_name)
+        if label in self.federation.mounts:
+            label = os.path.relpath(libraryFolder(file_name), application_path)
+        with open(mounts_file, 'a') as fout:
+            fout.write('{}\t{}\n'.format(label, os.path.relpath(file_name, os.path.dirname(mounts_file))))
+        self.federation.mount(label, file_name)
+        messagebox.showinfo(message="Mounted {} as '{}'!".format(file_name, label))
+        self.root.update()
+
+    # the current library is searched as well
+    def localLibraries(self):
+        return [(os.path.basename(application_path), application_path, self.lib)]
+
+    # find papers by the current inputs of the paper information in all libraries
+    def findFederated(self):
+        fields = {'title': self.add_title_input.get(), 'author': self.add_author_input.get(), 'conference': self.add_conference.get(),
+                'year': str(self.add_year_input.get()), 'tag': self.add_tag_input.get(), 'project': self.add_project_input.get(), 'dataset': self.add_dataset_input.get()}
+        local = self.localLibraries()
+        self.runTask("Find in all", lambda task: self.federation.find(fields, local), self.showFederated)
+
+    # papers of the selected filter in all libraries
+    def filterFederated(self):
+        if self.cur_filter_index < 0 or self.cur_filter_index >= len(self.display_filter_names):
+            messagebox.showinfo(message="Please select a filter first!")
+            self.root.update()
+            return
+        filter_type, filter_name = self.filter_category.get(), self.display_filter_names[self.cur_filter_index]
+        local = self.localLibraries()
+        self.runTask("Filter in all", lambda task: self.federation.filter(filter_type, filter_name, local), self.showFederated)
+
+    def showFederated(self, found):
+        results, errors = found
+        if len(results) < 1 and len(errors) < 1:
+            messagebox.showinfo(message='Find nothing!')
+            self.root.update()
+            return
+        FederatedResultsDialog(self.root, results, errors, self.openPaper)
+
+    def builtOfflineIndex(self, count):
+        messagebox.showinfo(message="Indexed {} records into {}!".format(count, os.path.relpath(offline_index_file, application_path)))
+        self.root.update()
+
+    # resolve the bib of needRevise papers by their titles in the offline index
+    def resolveOffline(self):
+        if not self.offline_index.exists():
+            messagebox.showinfo(message="Please build the offline index first!")
+            self.root.update()
+            return
+
+        paper_ids = [pi for pi in self.lib.findToRevise() if len(self.lib.papers[pi].title) > 0]
+        titles = [self.lib.papers[pi].title for pi in paper_ids]
+        self.runTask("Resolve offline", lambda task: self.offline_index.lookup(titles), lambda found: self.resolvedOffline(paper_ids, found))
+
+    def resolvedOffline(self, paper_ids, found):
+        resolved_count = 0
+        with self.lib.transaction():
+            for pi in paper_ids:
+                # removed meanwhile
+                if pi not in self.lib.papers: continue
+                paper = self.lib.papers[pi]
+                key = normalizeTitle(paper.title)
+                if key not in found: continue
+                b = bibParser.parse(found[key], self.lib)
+                self.lib.revisePaperBib(pi, b)
+                resolved_count += 1
+                if paper.checkState() == 0:
+                    paper._need_revise = False
+
+        messagebox.showinfo(message="Resolved {} of {} papers offline!".format(resolved_count, len(paper_ids)))
+        if resolved_count > 0:
+            self.setFilter('others', 'needRevise')
+            self.serializeMode()
+        self.root.update()
+
     # todo: parse pdf ?
     def fetchGS(self):
-        sufficient_info = True
-        bibtex = ""
-
         tmp_bib = Bib()
         tmp_bib = self.collectBibData(tmp_bib)
         query_str = tmp_bib.shortString()
+        title = tmp_bib.title
 
-        if len(tmp_bib.title) < 1:
+        if len(title) < 1:
             tmp_path = self.add_path_input.get().strip()
             title = self.extractTitleFromPath(tmp_path)
-            if len(title) < 1 :
-                sufficient_info = False
             query_str = title + tmp_bib.shortString()
 
-        if sufficient_info:
+        self.runTask("Web", lambda task: self.queryBibtex(title, query_str), self.displayFetchedBib, on_error=self.fetchFailed, button=self.gScholar_button)
+
+    # runs on a worker
+    def queryBibtex(self, title, query_str):
+        bibtex = ""
+        # require more data
+        if len(title) < 1: return bibtex
+
+        # the offline index first, if any
+        if self.offline_index.exists():
+            found = self.offline_index.lookup([title])
+            bibtex = found.get(normalizeTitle(title), "")
+
+        if len(bibtex) < 1:
             result = bibParser.query(query_str)
             if len(result) > 0 :
                 bibtex = result[0]
+        return bibtex
 
+    def fetchFailed(self, error):
+        self.displayFetchedBib("")
+
+    def displayFetchedBib(self, bibtex):
         if len(bibtex) > 0:
             self.add_bib_input.delete(1.0, END)
             self.add_bib_input.insert(1.0, bibtex)
@@ -1854,12 +5454,65 @@ class LibraryGUI:
         else:
             messagebox.showinfo(message="Can't find it on Google Scholar, bad network or require more data!\n")
             self.root.update()
+    # background tasks
+
+    # button: disabled while the task runs, e.g., to avoid running it twice
+    def runTask(self, label, fn, on_done, on_error=None, button=None, on_finish=None):
+        if button is not None:
+            button.config(state=DISABLED)
+        def finished():
+            if button is not None: button.config(state=NORMAL)
+            if on_finish is not None: on_finish()
+        if on_error is None:
+            on_error = lambda error: self.showTaskError(label, error)
+        return self.tasks.submit(label, fn, on_done, on_error, finished)
+
+    def showTaskError(self, label, error):
+        messagebox.showinfo(message="{} failed!\n{}".format(label, error))
+        self.root.update()
+
+    def cancelTasks(self):
+        self.tasks.cancelAll()
+
+    def updateTaskStatus(self, tasks):
+        if len(tasks) == 0:
+            self.status_var.set("Ready")
+            self.task_progress["value"] = 0
+            self.cancel_task_button.config(state=DISABLED)
+            return
+        current, total, message = tasks[0].progress
+        status = tasks[0].label
+        if len(message) > 0:
+            status += ': ' + message
+        if len(tasks) > 1:
+            status += ' (+{} queued)'.format(len(tasks)-1)
+        self.status_var.set(status)
+        self.task_progress["maximum"] = max(total, 1)
+        self.task_progress["value"] = current if total > 0 else 0
+        self.cancel_task_button.config(state=NORMAL)
+
     # event
 
     def closeWindow(self):
+        self.cancelAutosave()
+        self.tasks.shutdown()
+        self.federation.shutdown()
         if str(self.serialize_button['state']) == NORMAL and messagebox.askokcancel("Exit","Do you want to sync before exit?") :
-            f = open(lib_file, 'wb')
-            pickle_dump(self.lib, f)
+            # the changes of another computer merged first, at once
+            self.saver.flush()
+            if self.storage.changed():
+                try:
+                    self.applyReload(self.loadReload(self.reloadLocal()), self.lib.generation)
+                except Exception:
+                    # e.g., a file being synchronized, the write is refused then
+                    pass
+            self.saver.save(self.lib)
+            error = self.saver.flush()
+            if error is not None:
+                messagebox.showinfo(message='Save lib data failed!\n{}'.format(error))
+        # finish pending writes before exit
+        self.saver.flush()
+        self.saveIndexes()
         self.root.destroy()
 
     def filterListingEvent(self, event):
@@ -1876,33 +5529,37 @@ class LibraryGUI:
         if len(filter_idx) > 0:
             self.setDisplayFilter(filter_idx[0])
 
+    def filterPapers(self, filter_type, filter_name):
+        paper_ids = set()
+        if filter_type in self.filter_dict:
+            filters = self.filter_dict[filter_type][0]
+            if filter_type == 'year' or filter_type == 'rating':
+                paper_ids = filters.get(filter_name, set())
+            elif filter_type == 'others':
+                paper_ids = filters[filter_name]()
+            elif filter_name in filters:
+                paper_ids = filters[filter_name].papers
+        return paper_ids
+
     def setDisplayFilter(self, idx):
         self.display_filter.selection_clear(0, END)
         self.cur_filter_index = -1
-        displayed_filternames = self.display_filter.get(0, "end")
         self.addMode()
 
-        if idx >= 0 and idx < len(displayed_filternames):
+        if idx >= 0 and idx < len(self.display_filter_names):
             self.display_filter.selection_set(idx)
             self.cur_filter_index = idx
 
             filter_type = self.filter_category.get()
-            filter_name = self.display_filter.get(idx)
-            paper_ids = set()
-            if filter_type in self.filter_dict:
-                filters = self.filter_dict[filter_type][0]
-                if filter_type == 'year' or filter_type == 'rating':
-                    paper_ids = filters[filter_name]
-                elif filter_type == 'others':
-                    paper_ids = filters[filter_name]()
-                else:
-                    paper_ids = filters[filter_name].papers
+            filter_name = self.display_filter_names[idx]
+            paper_ids = self.filterPapers(filter_type, filter_name)
+            # narrowed by the search, if any
+            shown = self.viewPapers()
 
-            if len(paper_ids) == 0:
+            if len(shown) == 0:
                 self.clearDisplayPapers()
             else :
-                self.clearDisplayPapers(paper_ids)
-                self.displayPaper(list(paper_ids))
+                self.showPapers(shown)
 
                 treeid = self.display_papers.get_children()[0]
                 paper_id = self.display_papers.item(treeid)['text']
@@ -1912,8 +5569,11 @@ class LibraryGUI:
                 # show progress
                 total_num = len(paper_ids)
                 if total_num > 0:
-                    unread_num = len( paper_ids & self.lib.findUnread())
-                    self.setProgress(total_num-unread_num, total_num)
+                    if filter_type == 'others' and filter_name == 'needRevise':
+                        read_num = len(paper_ids) - len(paper_ids & self.lib.findUnread())
+                    else:
+                        read_num = self.lib.filterStats(filter_type, filter_name)[1]
+                    self.setProgress(read_num, total_num)
             # present the filter name in paper information
             # entry, text, combobox, spin, and check button
             if filter_type == 'conference':
@@ -1930,6 +5590,7 @@ class LibraryGUI:
 
     def selectPaperEvent(self, event):
         self.selectMode()
+        self.prefetchPapers()
     
     def clickPaperEvent(self, event):
         tree_id = self.display_papers.focus()
@@ -1937,6 +5598,23 @@ class LibraryGUI:
             paper_id = self.display_papers.item(tree_id)['text']
             self.cur_paper = self.lib.papers[paper_id]
             self.selectMode()
+            self.prefetchPapers()
+
+    # read the focused paper and its neighbouring rows ahead, so that opening one is quick
+    def prefetchPapers(self):
+        tree_id = self.display_papers.focus()
+        if self.prefetcher is None or len(tree_id) < 1: return
+        tree_ids = [tree_id]
+        prev_id = next_id = tree_id
+        for i in range(PREFETCH_NEIGHBORS):
+            next_id = self.display_papers.next(next_id) if len(next_id) > 0 else ''
+            prev_id = self.display_papers.prev(prev_id) if len(prev_id) > 0 else ''
+            tree_ids += [t for t in (next_id, prev_id) if len(t) > 0]
+        papers = [self.lib.papers.get(self.display_papers.item(t)['text']) for t in tree_ids]
+        full_paths = [p.full_path for p in papers if p is not None and len(p.path) > 0]
+        if full_paths != self.prefetched:
+            self.prefetched = full_paths
+            self.prefetcher.prefetch(full_paths)
 
     def openPaperEvent(self, event):
         self.clickPaperEvent(event)
@@ -1996,12 +5674,31 @@ class LibraryGUI:
     
     # display data
     
+    # add the rows of papers in the order of the others
     def displayPaper(self, paper_ids):
-        paper_ids.sort(reverse=True)
-        for pi in paper_ids:
-            if pi in self.paper_to_tree : continue
-            tree_id = self.display_papers.insert('', 'end', text=pi, values=self.display_columns_values(self.lib.papers[pi]))
-            self.paper_to_tree[pi] = tree_id
+        self.showPapers(set(self.paper_to_tree) | set(paper_ids))
+
+    def displayRelated(self, paper_id):
+        self.display_related.delete(0, END)
+        self.related_ids = []
+        if paper_id not in self.lib.papers: return
+        for sim, pi in self.lib.findRelatedPapers(paper_id):
+            self.related_ids.append(pi)
+            self.display_related.insert(END, self.lib.papers[pi].title)
+
+    # select the related paper in the paper list, displayed if filtered out
+    def relatedPaperEvent(self, event):
+        selection = self.display_related.curselection()
+        if len(selection) < 1: return
+        paper_id = self.related_ids[selection[0]]
+        if paper_id not in self.lib.papers: return
+        if paper_id not in self.paper_to_tree:
+            self.displayPaper([paper_id])
+        tree_id = self.paper_to_tree[paper_id]
+        self.cur_paper = self.lib.papers[paper_id]
+        self.display_papers.selection_set(tree_id)
+        self.display_papers.focus(tree_id)
+        self.display_papers.see(tree_id)
 
     def displayData(self, paper):
         self.displayBibData(paper.bib)
@@ -2049,6 +5746,7 @@ class LibraryGUI:
 
     def clearFilter(self):
         self.display_filter.delete(0, END)
+        self.display_filter_names = []
         self.cur_filter_index = -1
         self.setProgress(0,1)
 
@@ -2074,9 +5772,287 @@ class LibraryGUI:
         self.hasRead.set(False)
 
 
+class LibraryService:
+    # read-only library loaded from a storage, reloaded when the storage changes
+    # a reload swaps the whole library, so readers holding the former one are never disturbed
+    def __init__(self, storage, reload_interval=SERVER_RELOAD_INTERVAL):
+        self.storage = storage
+        self.reload_interval = reload_interval
+        self.lock = threading.Lock()
+        self.lib = Library()
+        self.signature = None
+        self.generation = 0
+        self.etag = self.signatureTag(None)
+        self.checked = 0
+        self.loading = False    # a reader is reloading, the others keep the former library meanwhile
+        self.current()
+
+    # return (library, generation, etag), the generation changes with each reload
+    # the etag is of the storage signature loaded, so that it also tells the library of another run of the server
+    def current(self):
+        with self.lock:
+            now = time.time()
+            if now - self.checked < self.reload_interval or self.loading:
+                return self.lib, self.generation, self.etag
+            self.checked = now
+            self.loading = True
+        # loaded outside the lock, only by the reader claiming the check
+        lib = None
+        try:
+            signature = self.storage.signature()
+            if signature != self.signature:
+                lib = self.storage.load()
+            if lib is not None:
+                # built once here rather than lazily by concurrent readers
+                lib.getConferenceMatcher()
+        finally:
+            with self.lock:
+                self.loading = False
+                if lib is not None:
+                    self.lib = lib
+                    self.signature = signature
+                    self.generation += 1
+                    self.etag = self.signatureTag(signature)
+        with self.lock:
+            return self.lib, self.generation, self.etag
+
+    @staticmethod
+    def signatureTag(signature):
+        return '"{}"'.format(hashlib.sha1(repr(signature).encode('utf8')).hexdigest()[:16])
+
+    @staticmethod
+    def paperSummary(paper):
+        return {'id': paper.id, 'title': paper.title, 'author': [a.label for a in paper.bib.author], 'conference': paper.conference,
+                'year': paper.bib.year, 'path': paper.path, 'hasRead': paper.hasRead, 'rating': paper._rating}
+
+    @classmethod
+    def paperDetail(cls, paper):
+        detail = cls.paperSummary(paper)
+        detail.update({'tag': [t.label for t in paper._tag], 'project': [p.label for p in paper._project], 'dataset': [d.label for d in paper._dataset],
+                'comment': paper.comment, 'hasGithub': paper.hasGithub, 'needRevise': paper._need_revise, 'bibtex': paper.bibtex})
+        return detail
+
+    # paper ids of a filter, the same as the filter area of gui
+    @staticmethod
+    def filterPapers(lib, filter_type, filter_name):
+        if filter_type in ('year', 'rating'):
+            filters = lib.years if filter_type == 'year' else lib.ratings
+            return filters.get(int(filter_name), set())
+        if filter_type == 'others':
+            others = {'unRead': lib.findUnread, 'hasGithub': lib.findGithub, 'needRevise': lib.findToRevise}
+            return others[filter_name]() if filter_name in others else set()
+        filters = {'conference': lib.conferences, 'author': lib.authors, 'dataset': lib.datasets, 'tag': lib.tags, 'project': lib.projects}
+        if filter_type in filters and filter_name in filters[filter_type]:
+            return filters[filter_type][filter_name].papers
+        return set()
+
+    @staticmethod
+    def filterNames(lib):
+        names = {'conference': lib.conferences, 'year': lib.years, 'author': lib.authors, 'dataset': lib.datasets, 'tag': lib.tags, 'project': lib.projects, 'rating': lib.ratings}
+        names = dict([(k, sorted([str(n) for n in names[k]])) for k in names])
+        names['others'] = ['unRead', 'hasGithub', 'needRevise']
+        return names
+
+    # return (status, content type, body) of a GET request
+    # current: (library, generation, etag) of current(), the one the response is tagged with
+    def handle(self, path, query, current=None):
+        lib, generation, etag = current if current is not None else self.current()
+        fields = dict([(k, query[k][-1]) for k in query])
+        parts = [p for p in path.split('/') if len(p) > 0]
+
+        if parts == ['papers'] or parts == ['bibtex']:
+            # options of the query, not fields to match
+            fuzzy, window = fields.pop('fuzzy', '0') == '1', int(fields.pop('window', '0'))
+            if len(fields) > 0:
+                paper_ids = lib.findPaper(lib.buildQuery(fields), support_fuzzy=fuzzy, fuzzy_window=window)
+            else:
+                paper_ids = list(lib.papers.keys())
+            paper_ids = sorted(paper_ids, reverse=True)
+            if parts == ['bibtex']:
+                return 200, 'text/plain', '\n\n'.join([lib.papers[pi].bibtex for pi in paper_ids])
+            return 200, 'application/json', {'generation': generation, 'papers': [self.paperSummary(lib.papers[pi]) for pi in paper_ids]}
+        elif len(parts) in (2, 3) and parts[0] == 'papers' and parts[1].isdigit() and int(parts[1]) in lib.papers:
+            paper = lib.papers[int(parts[1])]
+            if len(parts) == 3 and parts[2] == 'bibtex':
+                return 200, 'text/plain', paper.bibtex
+            elif len(parts) == 2:
+                return 200, 'application/json', {'generation': generation, 'paper': self.paperDetail(paper)}
+        elif parts == ['search'] and 'q' in fields:
+            # full text search pushed down to the storage if it can, otherwise title and author words
+            paper_ids = self.storage.search(fields['q'])
+            if paper_ids is None:
+                paper_ids = lib.searchTokens(fields['q'])
+            paper_ids = sorted([pi for pi in paper_ids if pi in lib.papers], reverse=True)
+            return 200, 'application/json', {'generation': generation, 'papers': [self.paperSummary(lib.papers[pi]) for pi in paper_ids]}
+        elif parts == ['filters']:
+            return 200, 'application/json', {'generation': generation, 'filters': self.filterNames(lib)}
+        elif len(parts) == 3 and parts[0] == 'filters':
+            paper_ids = sorted(self.filterPapers(lib, parts[1], parts[2]), reverse=True)
+            return 200, 'application/json', {'generation': generation, 'papers': [self.paperSummary(lib.papers[pi]) for pi in paper_ids]}
+        return 404, 'application/json', {'error': 'not found'}
+
+class LibraryFederation:
+    # libraries of other folders mounted to be found and filtered together with the current one
+    # each is read-only by a LibraryService, loaded by its first query and reloaded once changed
+    # a query runs on all the libraries at once, so it takes as long as the slowest one
+    def __init__(self, workers=FEDERATION_WORKERS):
+        self.mounts = {}        # label: library file
+        self.services = {}      # label: LibraryService, once loaded
+        self.lock = threading.Lock()
+        self.executor = ThreadPoolExecutor(max_workers=workers)
+
+    # [(label, library file)] of a mounts file, each line a library file relative to the program folder,
+    # optionally after a label separated by tab or four spaces, the same as conference.dat
+    @staticmethod
+    def loadMounts(file_name):
+        mounts = []
+        if os.path.isfile(file_name):
+            with open(file_name) as fin:
+                for line in fin.readlines():
+                    items = re.split('\t|    ', line.strip())
+                    if len(items[-1]) < 1 or len(items) > 2: continue
+                    lib_file = os.path.join(os.path.dirname(os.path.abspath(file_name)), items[-1].strip())
+                    mounts.append((items[0].strip() if len(items) == 2 else LibraryFederation.labelOf(lib_file), lib_file))
+        return mounts
+
+    # the folder name of a library by default
+    @staticmethod
+    def labelOf(file_name):
+        return os.path.basename(libraryFolder(file_name))
+
+    def mount(self, label, file_name):
+        with self.lock:
+            self.mounts[label] = file_name
+            self.services.pop(label, None)
+
+    def unmount(self, label):
+        with self.lock:
+            self.mounts.pop(label, None)
+            self.services.pop(label, None)
+
+    # runs on a worker
+    def queryMount(self, label, file_name, query):
+        with self.lock:
+            service = self.services.get(label)
+        if service is None:
+            service = LibraryService(storageOf(file_name))
+            if service.signature is None:
+                raise IOError("no library in " + file_name)
+            with self.lock:
+                if self.mounts.get(label) == file_name:
+                    service = self.services.setdefault(label, service)
+        lib, generation, etag = service.current()
+        return lib, query(lib)
+
+    # query(lib) -> paper ids run on every mounted library and on the given ones [(label, folder, lib)] in parallel
+    # return ([(label, folder, paper)] newest first in each library, {label: error of a library failed})
+    def query(self, query, local=()):
+        with self.lock:
+            mounts = list(self.mounts.items())
+        futures = [(label, folder, self.executor.submit(lambda lib: (lib, query(lib)), lib)) for label, folder, lib in local]
+        futures += [(label, libraryFolder(file_name), self.executor.submit(self.queryMount, label, file_name, query)) for label, file_name in mounts]
+        results, errors = [], {}
+        for label, folder, future in futures:
+            try:
+                lib, paper_ids = future.result()
+            except Exception as e:
+                # a broken library shall never break the search of the others
+                errors[label] = e
+                continue
+            results += [(label, folder, lib.papers[pi]) for pi in sorted(paper_ids, reverse=True) if pi in lib.papers]
+        return results, errors
+
+    # the same as Find of the paper information, by the fields of LibraryService
+    def find(self, fields, local=(), support_fuzzy=True, fuzzy_window=2):
+        return self.query(lambda lib: lib.findPaper(lib.buildQuery(fields), support_fuzzy=support_fuzzy, fuzzy_window=fuzzy_window), local)
+
+    # the same as the filter area
+    def filter(self, filter_type, filter_name, local=()):
+        return self.query(lambda lib: list(LibraryService.filterPapers(lib, filter_type, str(filter_name))), local)
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False)
+
+class LibraryRequestHandler(BaseHTTPRequestHandler):
+    # self.server.service: LibraryService
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        service = self.server.service
+        # responses only depend on the url and the library loaded, both taken from one snapshot
+        current = service.current()
+        etag = current[2]
+        if self.headers.get('If-None-Match') == etag:
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            self.end_headers()
+            return
+        try:
+            status, content_type, body = service.handle(unquote(url.path), parse_qs(url.query), current)
+        except (ValueError, KeyError, sqlite3.Error) as e:
+            status, content_type, body = 400, 'application/json', {'error': str(e)}
+
+        if content_type == 'application/json':
+            body = json.dumps(body)
+        body = body.encode('utf8')
+        self.send_response(status)
+        self.send_header('Content-Type', content_type + '; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        if status == 200:
+            self.send_header('ETag', etag)
+        self.end_headers()
+        self.wfile.write(body)
+
+class LibraryHTTPServer(ThreadingHTTPServer):
+    daemon_threads = True
+    # parallel clients shall not wait for the listen backlog
+    request_queue_size = 128
+
+def serve(host=SERVER_HOST, port=SERVER_PORT, storage=None):
+    if storage is None: storage = openStorage()
+    server = LibraryHTTPServer((host, port), LibraryRequestHandler)
+    server.service = LibraryService(storage)
+    print("Serving {} on http://{}:{}/".format(storage.file_name, host, server.server_address[1]))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+def mergeInto(storage, file_name, base_file_name=None):
+    lib = storage.load()
+    if lib is None: lib = Library()
+    copies = [storageOf(f).load() for f in [file_name] + ([base_file_name] if base_file_name else [])]
+    if None in copies:
+        print("No library in {}".format(file_name if copies[0] is None else base_file_name))
+        return
+    merge = LibraryMerge(lib, *copies)
+    print(merge.summary())
+    if merge.changed():
+        merge.apply(lib)
+        storage.save(lib)
+
 def main():
+    parser = argparse.ArgumentParser(description="Cloud Paper Manager")
+    parser.add_argument('--serve', action='store_true', help="serve the library read-only over http instead of the gui")
+    parser.add_argument('--host', default=SERVER_HOST)
+    parser.add_argument('--port', type=int, default=SERVER_PORT)
+    parser.add_argument('--backend', choices=['pickle', 'sqlite', 'shards'], help="storage of the library, by default sqlite if 'papers.db' exists, shards if 'papers.shards' exists, otherwise pickle")
+    parser.add_argument('--merge', metavar='COPY', help="merge a copy of the library, e.g., a conflicted copy of the cloud sync, into the library and exit")
+    parser.add_argument('--base', metavar='BASE', help="the common former copy of the library for --merge, if any")
+    parser.add_argument('--blobs', action='store_true', default=None, help="keep notes and bibtex in 'papers.blobs', so that editing them writes little; by default if it exists, not for sqlite")
+    args = parser.parse_args()
+    storage = openStorage(args.backend, args.blobs)
+    if args.merge:
+        mergeInto(storage, args.merge, args.base)
+        return
+    if args.serve:
+        serve(args.host, args.port, storage)
+        return
+
     # instantiation
-    lg = LibraryGUI()
+    lg = LibraryGUI(storage)
     lg.init()
     lg.gui_arrang()
     # main program
@@ -2085,4 +6061,6 @@ def main():
 
 
 if __name__ == "__main__":
+    # the import process pool in a packaged program
+    multiprocessing.freeze_support()
     main()
\ No newline at end of file